@@ -70,6 +70,9 @@ class UsageStatsResponse(BaseModel):
     """Response model for usage statistics"""
     total_requests: int = Field(..., description="Total number of requests")
     total_tokens: int = Field(..., description="Total tokens used")
+    prompt_tokens: int = Field(0, description="Input tokens used")
+    completion_tokens: int = Field(0, description="Output tokens used")
+    cached_tokens: int = Field(0, description="Input tokens served from the prompt cache")
     total_cost: float = Field(..., description="Total estimated cost")
     daily_average: float = Field(..., description="Average requests per day")
     period_days: int = Field(..., description="Period covered in days")
@@ -0,0 +1,161 @@
+"""
+Pre-fork server runner for the AI service
+"""
+
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, List
+
+import uvicorn
+
+from config.settings import get_settings, Settings
+
+logger = logging.getLogger(__name__)
+
+def build_config(app, settings: Settings) -> uvicorn.Config:
+    """uvicorn configuration from settings"""
+    return uvicorn.Config(
+        app,
+        host=settings.host,
+        port=settings.port,
+        log_level=settings.log_level.lower(),
+        access_log=settings.server_access_log,
+        backlog=settings.server_backlog,
+        limit_concurrency=settings.server_limit_concurrency or None,
+        timeout_keep_alive=settings.server_keepalive_timeout,
+        timeout_graceful_shutdown=settings.server_graceful_timeout or None
+    )
+
+def warm():
+    """Build process-wide state before forking so workers share it copy-on-write
+
+    Only pure data is built here. The OpenAI client, its connection pool and
+    the background threads (ledger writer, loop monitor, profiler) are created
+    lazily inside each worker, because sockets and threads do not survive a
+    fork.
+    """
+    from app.services import prompt_templates  # noqa: F401
+    from app.services.conversation_service import get_conversation_service
+    from app.services.quantile_service import get_quantile_service
+    from app.services.usage_service import get_usage_service
+    import openai  # noqa: F401
+
+    started = time.perf_counter()
+    get_conversation_service()
+    get_quantile_service()
+    get_usage_service()
+    # Keep the warmed objects out of future collections so the collector
+    # does not touch (and copy) their pages in every worker
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Warmed shared state in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+def per_worker_state(settings: Settings) -> List[str]:
+    """Features in use whose state each worker keeps to itself"""
+    features = ["rate limits"]
+    if settings.token_quota_user_tpm > 0 or settings.token_quota_business_tpm > 0:
+        features.append("token quotas")
+    features.append("Idempotency-Key results")
+    features.append("conversation history")
+    return features
+
+def _serve_worker(config: uvicorn.Config, sock: socket.socket, index: int, metrics_dir: str):
+    from app.services.metrics_service import get_metrics_service
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    get_metrics_service().enable_multiprocess(metrics_dir, str(index))
+    # The objects frozen in the parent stay frozen, so the collector never
+    # writes to their pages and they stay shared with the parent
+    uvicorn.Server(config).run(sockets=[sock])
+
+def _spawn(config: uvicorn.Config, sock: socket.socket, index: int, metrics_dir: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            _serve_worker(config, sock, index, metrics_dir)
+        except BaseException:
+            logger.exception("Worker crashed")
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+def run(app, settings: Settings = None):
+    """Serve app with ``settings.workers`` processes sharing one listening socket
+
+    The socket is bound and the application imported and warmed once in the
+    parent, then workers are forked. The parent restarts workers that exit
+    unexpectedly and forwards SIGINT/SIGTERM for a graceful shutdown. Workers
+    share their metrics through a temporary directory, so /metrics on any
+    of them covers all of them.
+
+    Several workers are refused while features keeping per-worker state are
+    in use, unless ``allow_per_worker_state`` is set.
+    """
+    settings = settings or get_settings()
+    config = build_config(app, settings)
+    workers = max(1, settings.workers)
+    if workers == 1 or not hasattr(os, "fork"):
+        uvicorn.Server(config).run()
+        return
+
+    features = per_worker_state(settings)
+    if features and not settings.allow_per_worker_state:
+        raise SystemExit(
+            f"WORKERS={workers} would keep {', '.join(features)} separately in each worker, "
+            f"so limits would allow up to {workers}x the configured values and keyed retries "
+            f"and conversations would depend on the worker a request lands on. "
+            f"Run a single worker, or set ALLOW_PER_WORKER_STATE=true to accept this"
+        )
+    logger.warning(f"Keeping {', '.join(features)} per worker across {workers} workers")
+
+    sock = config.bind_socket()
+    warm()
+    metrics_dir = tempfile.mkdtemp(prefix="caboai-metrics-")
+
+    children: Dict[int, int] = {}  # pid -> worker index
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in range(workers):
+        children[_spawn(config, sock, index, metrics_dir)] = index
+    logger.info(f"Started {workers} workers on {settings.host}:{settings.port} (parent {os.getpid()})")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if stopping or index is None:
+            continue
+        logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+        time.sleep(1.0)
+        # The replacement takes over the worker label, so its counters
+        # restart from zero like any process restart
+        children[_spawn(config, sock, index, metrics_dir)] = index
+
+    sock.close()
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    logger.info("All workers stopped")
@@ -0,0 +1,156 @@
+"""
+Adaptive concurrency limits for inbound chat requests and outbound OpenAI calls
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Any
+
+from config.settings import get_settings
+from app.services.metrics_service import get_metrics_service, Counter
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by latency and overload signals
+
+    A request is admitted while fewer than ``limit`` are in flight; otherwise
+    it is shed immediately instead of queueing. Each completed request that
+    used the limit grows it by ``1 / limit`` (about +1 per round trip). A
+    request that was rejected upstream (429, timeout) or took longer than
+    ``latency_tolerance`` times the long-run average latency shrinks it by
+    ``backoff``, at most once per round trip: only requests that started
+    after the previous decrease can trigger the next one.
+
+    The long-run average follows every latency sample, slow ones included.
+    A lasting latency step (longer replies, a slower model) therefore
+    becomes the new normal after a few round trips instead of counting as
+    overload forever and pinning the limit to ``minimum``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.9,
+        shed_counter: Optional[Counter] = None
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        self.baseline: Optional[float] = None  # EWMA of latency in seconds
+        self._last_decrease = 0.0
+        self.shed_counter = shed_counter
+        self.shed = 0
+        self.decreases = 0
+
+    def try_acquire(self) -> Optional[float]:
+        """Admit a request, returning its start time, or None when it must be shed"""
+        if self.inflight >= int(self.limit):
+            self.shed += 1
+            if self.shed_counter is not None:
+                self.shed_counter.inc(self.name)
+            return None
+        self.inflight += 1
+        return time.monotonic()
+
+    def release(self, started: float, overloaded: bool = False, sample: bool = True):
+        """Finish a request admitted at ``started``
+
+        ``overloaded`` marks an upstream rejection; ``sample=False`` releases
+        the slot without using the latency (e.g. for requests rejected early).
+        """
+        self.inflight -= 1
+        if not sample and not overloaded:
+            return
+
+        now = time.monotonic()
+        latency = now - started
+        rejected = overloaded
+        if not overloaded and self.baseline is not None:
+            overloaded = latency > self.baseline * self.latency_tolerance
+        if sample and not rejected:
+            self.baseline = latency if self.baseline is None else self.baseline * 0.99 + latency * 0.01
+
+        if overloaded:
+            if started > self._last_decrease:
+                self._last_decrease = now
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self.decreases += 1
+                logger.debug(f"{self.name} concurrency limit decreased to {int(self.limit)}")
+        elif (self.inflight + 1) * 2 >= self.limit:
+            # Only grow while the limit is actually being used
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "shed": self.shed,
+            "decreases": self.decreases,
+            "baseline_latency_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None
+        }
+
+class ConcurrencyService:
+    """Limiters for /chat handling and for OpenAI calls"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        metrics = get_metrics_service()
+        shed_counter = metrics.counter(
+            "caboai_load_shed_total", "Requests shed by the concurrency limiter", ("limiter",)
+        )
+        self.chat = AdaptiveLimiter(
+            "chat",
+            self.settings.chat_concurrency_initial,
+            self.settings.chat_concurrency_min,
+            self.settings.chat_concurrency_max,
+            self.settings.concurrency_latency_tolerance,
+            self.settings.concurrency_backoff,
+            shed_counter
+        )
+        self.openai = AdaptiveLimiter(
+            "openai",
+            self.settings.openai_concurrency_initial,
+            self.settings.openai_concurrency_min,
+            self.settings.openai_concurrency_max,
+            self.settings.concurrency_latency_tolerance,
+            self.settings.concurrency_backoff,
+            shed_counter
+        )
+        self.limiters = {"chat": self.chat, "openai": self.openai}
+
+        metrics.gauge(
+            "caboai_concurrency_limit", "Current adaptive concurrency limit",
+            lambda: {(name,): int(limiter.limit) for name, limiter in self.limiters.items()},
+            ("limiter",)
+        )
+        metrics.gauge(
+            "caboai_concurrency_inflight", "Requests currently admitted by the limiter",
+            lambda: {(name,): limiter.inflight for name, limiter in self.limiters.items()},
+            ("limiter",)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: limiter.get_stats() for name, limiter in self.limiters.items()}
+
+# Singleton instance
+_concurrency_service = None
+_concurrency_service_lock = threading.Lock()
+
+def get_concurrency_service() -> ConcurrencyService:
+    """Get concurrency limiter service instance"""
+    global _concurrency_service
+    if _concurrency_service is None:
+        with _concurrency_service_lock:
+            if _concurrency_service is None:
+                _concurrency_service = ConcurrencyService()
+    return _concurrency_service
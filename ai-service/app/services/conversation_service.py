@@ -4,11 +4,14 @@ Conversation memory and context tracking service
 
 import json
 import logging
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, asdict
 from uuid import uuid4
 
+from app.services.tracing_service import span
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -105,6 +108,15 @@ class ConversationService:
         metadata: Dict[str, Any] = None
     ) -> str:
         """Create a new conversation"""
+        with span("conversation_write"):
+            return self._create_conversation(user_email, business_id, metadata)
+    
+    def _create_conversation(
+        self,
+        user_email: Optional[str],
+        business_id: Optional[str],
+        metadata: Optional[Dict[str, Any]]
+    ) -> str:
         conversation_id = str(uuid4())
         now = datetime.utcnow()
         
@@ -141,14 +153,15 @@ class ConversationService:
         metadata: Dict[str, Any] = None
     ) -> bool:
         """Add message to conversation"""
-        conversation = self._conversations.get(conversation_id)
-        if not conversation:
-            logger.warning(f"Conversation {conversation_id} not found")
-            return False
-        
-        conversation.add_message(role, content, metadata)
-        logger.debug(f"Added {role} message to conversation {conversation_id}")
-        return True
+        with span("conversation_write"):
+            conversation = self._conversations.get(conversation_id)
+            if not conversation:
+                logger.warning(f"Conversation {conversation_id} not found")
+                return False
+            
+            conversation.add_message(role, content, metadata)
+            logger.debug(f"Added {role} message to conversation {conversation_id}")
+            return True
     
     def get_conversation_history(
         self, 
@@ -217,6 +230,13 @@ class ConversationService:
         
         logger.info(f"Cleaned up {len(to_remove)} old conversations")
     
+    def get_store_sizes(self) -> Dict[str, int]:
+        """Sizes of the conversation store, without scanning it"""
+        return {
+            "conversations": len(self._conversations),
+            "conversation_users": len(self._user_conversations)
+        }
+    
     def get_analytics(self) -> Dict[str, Any]:
         """Get conversation analytics"""
         total_conversations = len(self._conversations)
@@ -243,10 +263,13 @@ class ConversationService:
 
 # Singleton instance
 _conversation_service = None
+_conversation_service_lock = threading.Lock()
 
 def get_conversation_service() -> ConversationService:
     """Get conversation service instance"""
     global _conversation_service
     if _conversation_service is None:
-        _conversation_service = ConversationService()
+        with _conversation_service_lock:
+            if _conversation_service is None:
+                _conversation_service = ConversationService()
     return _conversation_service
\ No newline at end of file
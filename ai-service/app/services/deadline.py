@@ -0,0 +1,40 @@
+"""
+Per-request time budget shared by the services handling a request
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+class Deadline:
+    """Point in time (monotonic) by which the response has to be sent"""
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, budget_seconds: float):
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        """Seconds left, negative once expired"""
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("caboai_request_deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the request being handled, if any"""
+    return _current_deadline.get()
+
+def start_deadline(budget_ms: Optional[int], settings) -> Optional[Deadline]:
+    """Start the current request's deadline
+
+    The budget is the caller's ``budget_ms`` capped at ``chat_deadline_ms``;
+    either may be unset (or 0). The deadline applies to the current task and
+    to tasks it creates afterwards.
+    """
+    budgets = [ms for ms in (budget_ms, settings.chat_deadline_ms) if ms and ms > 0]
+    deadline = Deadline(min(budgets) / 1000) if budgets else None
+    _current_deadline.set(deadline)
+    return deadline
@@ -0,0 +1,196 @@
+"""
+Background dependency prober backing the liveness and readiness probes
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Any
+from urllib.parse import urlparse
+
+from config.settings import get_settings
+from app.services.metrics_service import get_metrics_service
+
+logger = logging.getLogger(__name__)
+
+class DependencyStatus:
+    """Last probe result of one dependency"""
+
+    __slots__ = ("healthy", "latency_ms", "error", "checked_at")
+
+    def __init__(self):
+        self.healthy: Optional[bool] = None
+        self.latency_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "latency_ms": self.latency_ms,
+            "error": self.error,
+            "age_seconds": round(time.monotonic() - self.checked_at, 1) if self.checked_at else None
+        }
+
+class HealthProber:
+    """Probes OpenAI, the usage store and Redis on an interval and caches the results
+
+    Readiness handlers only read the cache, so a probe request never waits on
+    a dependency. A result older than three intervals counts as unhealthy.
+    With ``readiness_requires_openai`` off, the OpenAI check is still run and
+    reported but does not affect readiness.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._checks: Dict[str, Callable[[], Awaitable[None]]] = {"openai": self._check_openai}
+        if self.settings.usage_ledger_path:
+            self._checks["store"] = self._check_store
+        if self.settings.redis_url:
+            self._checks["redis"] = self._check_redis
+        self.statuses = {name: DependencyStatus() for name in self._checks}
+        self.required = [
+            name for name in self._checks
+            if name != "openai" or self.settings.readiness_requires_openai
+        ]
+        self._task: Optional[asyncio.Task] = None
+
+        get_metrics_service().gauge(
+            "caboai_dependency_up",
+            "Last probe result per dependency (1 healthy, 0 failing)",
+            lambda: {
+                (name,): int(status.healthy)
+                for name, status in self.statuses.items()
+                if status.healthy is not None
+            },
+            ("dependency",)
+        )
+
+    def start(self):
+        """Start probing from the running loop (call from a startup hook)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.settings.health_probe_interval)
+
+    async def probe(self):
+        """Run every check concurrently and update the cached statuses"""
+        await asyncio.gather(*(self._probe_one(name, check) for name, check in self._checks.items()))
+
+    async def _probe_one(self, name: str, check: Callable[[], Awaitable[None]]):
+        status = self.statuses[name]
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), self.settings.health_probe_timeout)
+            healthy, error = True, None
+        except asyncio.TimeoutError:
+            healthy, error = False, f"timed out after {self.settings.health_probe_timeout}s"
+        except Exception as e:
+            healthy, error = False, str(e) or type(e).__name__
+        if healthy != status.healthy:
+            log = logger.info if healthy else logger.warning
+            log(f"Dependency {name} is {'healthy' if healthy else 'unhealthy'}" + (f": {error}" if error else ""))
+        status.healthy = healthy
+        status.error = error
+        status.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        status.checked_at = time.monotonic()
+
+    async def _check_openai(self):
+        from app.services.openai_service import get_openai_service
+        from app.services.warmup import get_warmup
+
+        # Wait for the services the warm-up builds rather than building them
+        # here a second time
+        await get_warmup().build_services()
+        openai_service = get_openai_service()
+
+        async def check(upstream):
+            client = upstream.client.with_options(timeout=self.settings.health_probe_timeout, max_retries=0)
+            await client.models.list()
+
+        # Healthy while any endpoint answers; the probe also returns ejected
+        # endpoints to rotation once they answer again
+        errors = await openai_service.pool.probe(check)
+        if all(errors.values()):
+            if len(errors) == 1:
+                raise RuntimeError(next(iter(errors.values())))
+            raise RuntimeError("; ".join(f"{name}: {error}" for name, error in errors.items()))
+
+    async def _check_store(self):
+        def ping(path: str):
+            # The ledger creates the database on first use; until then there
+            # is nothing to check, and connecting must not create it
+            if not os.path.exists(path):
+                return
+            connection = sqlite3.connect(
+                f"{Path(path).absolute().as_uri()}?mode=ro", uri=True, timeout=self.settings.health_probe_timeout
+            )
+            try:
+                connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            finally:
+                connection.close()
+
+        await asyncio.to_thread(ping, self.settings.usage_ledger_path)
+
+    async def _check_redis(self):
+        url = urlparse(self.settings.redis_url)
+        reader, writer = await asyncio.open_connection(
+            url.hostname or "localhost", url.port or 6379, ssl=url.scheme == "rediss"
+        )
+        try:
+            password = url.password or self.settings.redis_password
+            if password:
+                auth = [url.username, password] if url.username else [password]
+                writer.write(_resp_command("AUTH", *auth))
+            writer.write(_resp_command("PING"))
+            await writer.drain()
+            if password:
+                reply = await reader.readline()
+                if not reply.startswith(b"+OK"):
+                    raise RuntimeError(f"AUTH failed: {reply.decode(errors='replace').strip()}")
+            reply = await reader.readline()
+            if not reply.startswith(b"+PONG"):
+                raise RuntimeError(f"unexpected PING reply: {reply.decode(errors='replace').strip()}")
+        finally:
+            writer.close()
+
+    def is_ready(self) -> bool:
+        stale_after = 3 * self.settings.health_probe_interval
+        now = time.monotonic()
+        return all(
+            self.statuses[name].healthy and now - self.statuses[name].checked_at <= stale_after
+            for name in self.required
+        )
+
+    def get_status(self) -> Dict[str, Any]:
+        return {name: status.to_dict() for name, status in self.statuses.items()}
+
+def _resp_command(*parts: str) -> bytes:
+    """Encode a Redis command in RESP"""
+    encoded = [part.encode() for part in parts]
+    return b"*%d\r\n" % len(encoded) + b"".join(b"$%d\r\n%s\r\n" % (len(part), part) for part in encoded)
+
+# Singleton instance
+_health_prober = None
+
+def get_health_prober() -> HealthProber:
+    """Get dependency health prober instance"""
+    global _health_prober
+    if _health_prober is None:
+        _health_prober = HealthProber()
+    return _health_prober
@@ -0,0 +1,146 @@
+"""
+Idempotency-Key handling for /chat: TTL result cache and in-flight deduplication
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from config.settings import get_settings
+from app.services.metrics_service import get_metrics_service
+
+logger = logging.getLogger(__name__)
+
+class StoredResponse:
+    """Body and status of a completed response, replayable any number of times"""
+
+    __slots__ = ("fingerprint", "body", "status_code", "media_type", "expires_at")
+
+    def __init__(self, fingerprint: str, response: Response, expires_at: float):
+        self.fingerprint = fingerprint
+        self.body = response.body
+        self.status_code = response.status_code
+        self.media_type = response.media_type
+        self.expires_at = expires_at
+
+    def replay(self) -> Response:
+        return Response(
+            self.body,
+            status_code=self.status_code,
+            media_type=self.media_type,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+class IdempotencyService:
+    """Deduplicates requests carrying the same idempotency key
+
+    A completed response is kept for ``idempotency_ttl_seconds`` in a store
+    bounded to ``idempotency_max_entries``; since every entry has the same
+    TTL, insertion order is expiry order and eviction pops from the front.
+    A duplicate that arrives while the first request is still generating
+    waits for that result instead of starting another generation. Reusing a
+    key with a different request body is rejected with 422.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.metrics = get_metrics_service()
+        self._completed: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    @staticmethod
+    def fingerprint(body: str) -> str:
+        return hashlib.sha256(body.encode()).hexdigest()
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        produce: Callable[[], Awaitable[Tuple[Response, bool]]]
+    ) -> Response:
+        """Return the response for key, producing it at most once
+
+        ``produce`` returns the response and whether it may be cached; only
+        successful generations are, so a retry after a fallback tries again.
+        """
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            self._check_fingerprint(inflight[0], fingerprint)
+            self.metrics.cache_requests.inc("idempotency", "attached")
+            outcome = await asyncio.shield(inflight[1])
+            if isinstance(outcome, StoredResponse):
+                return outcome.replay()
+            if not isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            # The original request was cancelled; the first waiter takes over
+            inflight = self._inflight.get(key)
+
+        stored = self._lookup(key)
+        if stored is not None:
+            self._check_fingerprint(stored.fingerprint, fingerprint)
+            self.metrics.record_cache("idempotency", True)
+            return stored.replay()
+
+        self.metrics.record_cache("idempotency", False)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            response, cacheable = await produce()
+            stored = StoredResponse(fingerprint, response, time.monotonic() + self.settings.idempotency_ttl_seconds)
+            if cacheable:
+                self._store(key, stored)
+            future.set_result(stored)
+            return response
+        except BaseException as e:
+            # Duplicates waiting on this request see the same error
+            future.set_result(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    @staticmethod
+    def _check_fingerprint(expected: str, actual: str):
+        if expected != actual:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request"
+            )
+
+    def _lookup(self, key: str):
+        stored = self._completed.get(key)
+        if stored is not None and stored.expires_at <= time.monotonic():
+            del self._completed[key]
+            return None
+        return stored
+
+    def _store(self, key: str, stored: StoredResponse):
+        self._completed.pop(key, None)
+        self._completed[key] = stored
+        now = time.monotonic()
+        while self._completed:
+            oldest = next(iter(self._completed.values()))
+            if oldest.expires_at > now and len(self._completed) <= self.settings.idempotency_max_entries:
+                break
+            self._completed.popitem(last=False)
+
+    def get_store_sizes(self) -> Dict[str, int]:
+        return {
+            "idempotency_results": len(self._completed),
+            "idempotency_inflight": len(self._inflight)
+        }
+
+# Singleton instance
+_idempotency_service = None
+
+def get_idempotency_service() -> IdempotencyService:
+    """Get idempotency service instance"""
+    global _idempotency_service
+    if _idempotency_service is None:
+        _idempotency_service = IdempotencyService()
+    return _idempotency_service
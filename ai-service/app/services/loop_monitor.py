@@ -0,0 +1,117 @@
+"""
+Event loop lag monitor and blocking-call detector
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional, Any
+
+from config.settings import get_settings
+from app.services.metrics_service import get_metrics_service
+
+logger = logging.getLogger(__name__)
+
+# Seconds; scheduling delay of a healthy loop is well under a millisecond
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class LoopMonitor:
+    """Measures event loop scheduling delay and reports blocking callbacks
+
+    A task on the loop sleeps for ``loop_lag_interval_ms`` and observes how
+    late it wakes up. A watchdog thread checks that task's heartbeat; when the
+    loop has not come back for longer than ``loop_block_threshold_ms`` it logs
+    the stack of the loop thread, which is the code holding the loop.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.interval = self.settings.loop_lag_interval_ms / 1000
+        self.threshold = self.settings.loop_block_threshold_ms / 1000
+        metrics = get_metrics_service()
+        self.lag = metrics.histogram(
+            "caboai_event_loop_lag_seconds", "Event loop scheduling delay", buckets=LAG_BUCKETS
+        )
+        self.blocked = metrics.counter(
+            "caboai_event_loop_blocked_total", "Loop stalls longer than the blocking threshold"
+        )
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    def start(self):
+        """Start monitoring the running loop (call from a startup hook)"""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def _measure(self):
+        interval = self.interval
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self.lag.observe(lag)
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            self.blocked.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable\n"
+            logger.warning(
+                f"Event loop blocked for over {stalled * 1000:.0f}ms; loop thread stack:\n{stack}"
+            )
+
+    async def stop(self):
+        """Stop the lag task and the watchdog thread"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "blocked_events": int(self.blocked.value())
+        }
+
+# Singleton instance
+_loop_monitor = None
+
+def get_loop_monitor() -> LoopMonitor:
+    """Get event loop monitor instance"""
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = LoopMonitor()
+    return _loop_monitor
@@ -0,0 +1,335 @@
+"""
+Prometheus-format metrics for the AI service
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; tuned for in-process stages (sub-millisecond) up to OpenAI round trips
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+    0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Counter:
+    """Monotonic counter; ``inc`` is a single dict update, safe on the event loop"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self, extra: str = "") -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+class Histogram:
+    """Fixed-bucket histogram; ``observe`` is a bisect and two increments"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts, sum]
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.bounds) + 1), 0.0]
+        series[0][bisect_left(self.bounds, value)] += 1
+        series[1] += value
+
+    def render(self, extra: str = "") -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                le = ",".join(filter(None, (extra, f'le="{_format_value(bound)}"')))
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels, extra)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels, extra)} {cumulative}")
+        return lines
+
+class Gauge:
+    """Gauge read from a callback at scrape time, so nothing runs on the hot path
+
+    The callback returns either a number or a mapping of label tuples to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], object],
+        labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self, extra: str = "") -> List[str]:
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {str(e)}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}"
+            for labels, value in values.items()
+            if value is not None
+        ]
+
+class MetricsService:
+    """Registry of service metrics rendered in the Prometheus text format
+
+    With several worker processes each one keeps its own series. Once
+    ``enable_multiprocess`` has been called, every series carries a
+    ``worker`` label and ``render`` also includes the other workers' series
+    from the snapshots they write to a shared directory, so any worker can
+    answer a scrape for all of them.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self.worker: Optional[str] = None
+        self._directory: Optional[str] = None
+
+        self.requests = self.counter(
+            "caboai_http_requests_total", "HTTP requests by route and status", ("route", "status")
+        )
+        self.request_duration = self.histogram(
+            "caboai_http_request_duration_seconds", "HTTP request latency by route", ("route",)
+        )
+        self.stage_duration = self.histogram(
+            "caboai_chat_stage_duration_seconds", "Latency of /chat pipeline stages", ("stage",)
+        )
+        self.openai_tokens = self.counter(
+            "caboai_openai_tokens_total", "OpenAI tokens by model and kind", ("model", "kind")
+        )
+        self.fallbacks = self.counter(
+            "caboai_fallback_responses_total", "Canned fallback responses served", ("reason",)
+        )
+        self.cancellations = self.counter(
+            "caboai_cancelled_requests_total", "Requests cancelled after the client disconnected", ("endpoint",)
+        )
+        self.cache_requests = self.counter(
+            "caboai_cache_requests_total", "Cache lookups by cache and result", ("cache", "result")
+        )
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], object],
+        labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self._register(Gauge(name, help, callback, labelnames))
+
+    def _register(self, metric):
+        """Add a metric, or return the one already registered under its name
+        
+        Registering the same definition again (e.g. from a second instance of
+        a service) returns the existing series; a gauge then reads from the
+        newest callback. A different definition under the same name is an
+        error.
+        """
+        existing = self._metrics.get(metric.name)
+        if existing is None:
+            self._metrics[metric.name] = metric
+            return metric
+        if (existing.kind, existing.help, existing.labelnames) != (metric.kind, metric.help, metric.labelnames) \
+                or getattr(existing, "bounds", None) != getattr(metric, "bounds", None):
+            raise ValueError(f"Metric {metric.name} already registered with a different definition")
+        if isinstance(existing, Gauge):
+            existing.callback = metric.callback
+        return existing
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def record_cache(self, cache: str, hit: bool):
+        self.cache_requests.inc(cache, "hit" if hit else "miss")
+
+    def enable_multiprocess(self, directory: str, worker: str):
+        """Label series with ``worker`` and share them through ``directory``"""
+        self._directory = directory
+        self.worker = worker
+
+    def _families(self) -> Dict[str, dict]:
+        extra = f'worker="{_escape(self.worker)}"' if self.worker is not None else ""
+        return {
+            metric.name: {"help": metric.help, "kind": metric.kind, "lines": metric.render(extra)}
+            for metric in self._metrics.values()
+        }
+
+    def write_snapshot(self, families: Optional[Dict[str, dict]] = None):
+        """Publish this worker's series to the other workers (blocking file I/O)"""
+        families = families if families is not None else self._families()
+        path = os.path.join(self._directory, f"worker-{self.worker}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(families, f)
+        os.replace(f"{path}.tmp", path)
+
+    async def publish(self, interval: float):
+        """Write a snapshot every ``interval`` seconds until cancelled
+
+        Series are rendered on the event loop, which is the only writer, and
+        written out in a thread.
+        """
+        while True:
+            await asyncio.to_thread(self.write_snapshot, self._families())
+            await asyncio.sleep(interval)
+
+    def _other_workers(self) -> List[Dict[str, dict]]:
+        snapshots = []
+        own = f"worker-{self.worker}.json"
+        for name in sorted(os.listdir(self._directory)):
+            if name == own or not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping metrics snapshot {name}: {str(e)}")
+        return snapshots
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        families = self._families()
+        if self._directory is not None:
+            for snapshot in self._other_workers():
+                for name, family in snapshot.items():
+                    if name in families:
+                        families[name]["lines"].extend(family["lines"])
+                    else:
+                        families[name] = family
+        lines = []
+        for name, family in families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            lines.extend(family["lines"])
+        lines.append("")
+        return "\n".join(lines)
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and latency per matched route"""
+
+    def __init__(self, app, metrics: Optional[MetricsService] = None):
+        self.app = app
+        self.metrics = metrics or get_metrics_service()
+        self._routes: Dict[object, str] = {}
+
+    def _route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        label = self._routes.get(endpoint)
+        if label is None:
+            router = scope.get("router")
+            for route in getattr(router, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    label = route.path
+                    break
+            else:
+                label = getattr(endpoint, "__name__", "unknown")
+            self._routes[endpoint] = label
+        return label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self._route_label(scope)
+            self.metrics.requests.inc(route, str(status))
+            self.metrics.request_duration.observe(time.perf_counter() - started, route)
+
+# Singleton instance
+_metrics_service = None
+_metrics_service_lock = threading.Lock()
+
+def get_metrics_service() -> MetricsService:
+    """Get metrics service instance"""
+    global _metrics_service
+    if _metrics_service is None:
+        with _metrics_service_lock:
+            if _metrics_service is None:
+                _metrics_service = MetricsService()
+    return _metrics_service
@@ -3,13 +3,17 @@ OpenAI Service for CaboAi intelligent email generation
 """
 
 import logging
-from typing import Dict, List, Optional, Any
-from openai import OpenAI, AsyncOpenAI
-from openai.types.chat import ChatCompletion
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple, Union
 import asyncio
-from functools import lru_cache
+import time
 
 from config.settings import get_settings
+from app.services.metrics_service import get_metrics_service
+from app.services.tracing_service import span
+from app.services.concurrency_service import get_concurrency_service
+from app.services.deadline import current_deadline
+from app.services.upstream_pool import Upstream, UpstreamPool
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +21,101 @@ class OpenAIService:
     """OpenAI service for intelligent email generation"""
     
     def __init__(self):
+        # The SDK is imported on first use so that processes only answering
+        # health checks do not pay for it
+        from openai import AsyncOpenAI
+        
         self.settings = get_settings()
-        self.client = AsyncOpenAI(api_key=self.settings.openai_api_key)
+        endpoints = self.settings.openai_endpoints or [{"name": "default"}]
+        # With several endpoints a failed request fails over to another one
+        # instead of being retried against the same endpoint
+        max_retries = self.settings.openai_max_retries if len(endpoints) == 1 else 0
+        self.pool = UpstreamPool(
+            [
+                Upstream(
+                    endpoint.get("name") or endpoint.get("base_url") or f"upstream{index}",
+                    AsyncOpenAI(
+                        api_key=endpoint.get("api_key") or self.settings.openai_api_key,
+                        base_url=endpoint.get("base_url"),
+                        max_retries=max_retries,
+                        http_client=get_http_client()
+                    ),
+                    model=endpoint.get("model"),
+                    weight=float(endpoint.get("weight", 1.0))
+                )
+                for index, endpoint in enumerate(endpoints)
+            ],
+            strategy=self.settings.openai_balancer,
+            eject_failures=self.settings.openai_eject_failures,
+            eject_seconds=self.settings.openai_eject_seconds
+        )
+        self.client = self.pool.upstreams[0].client
+        self.metrics = get_metrics_service()
+        self.limiter = get_concurrency_service().openai
+        self._system_prompts: Dict[tuple, str] = {}  # rendered system prompts by context
+        deadline_tokens = int(
+            (self.settings.chat_deadline_ms - self.settings.deadline_margin_ms) / 1000
+            * self.settings.deadline_tokens_per_second
+        )
+        if self.settings.chat_deadline_ms > 0 and deadline_tokens < self.settings.openai_max_tokens:
+            logger.warning(
+                f"CHAT_DEADLINE_MS={self.settings.chat_deadline_ms} leaves time for {deadline_tokens} tokens at "
+                f"DEADLINE_TOKENS_PER_SECOND, so replies are capped below OPENAI_MAX_TOKENS="
+                f"{self.settings.openai_max_tokens}"
+            )
+        self._system_prompt_chars = len(self._build_system_prompt("professional", "hospitality", "auto"))
+    
+    def estimate_request_tokens(
+        self,
+        email_content: str,
+        conversation_history: List[Dict[str, str]] = None,
+        business_context: Dict[str, Any] = None
+    ) -> int:
+        """
+        Estimate the tokens a request may consume before calling OpenAI
+        
+        The completion is assumed to use the full ``max_tokens`` budget left
+        by the request deadline.
+        """
+        return (
+            self.estimate_prompt_tokens(email_content, conversation_history, business_context)
+            + self._request_budget()[1]
+        )
+    
+    def _request_budget(self) -> Tuple[Optional[float], int]:
+        """Upstream timeout and ``max_tokens`` left by the current request deadline
+        
+        The timeout ends ``deadline_margin_ms`` before the deadline so there
+        is time to answer with the fallback; ``max_tokens`` is what can be
+        generated in that time at ``deadline_tokens_per_second``.
+        """
+        deadline = current_deadline()
+        if deadline is None:
+            return None, self.settings.openai_max_tokens
+        timeout = deadline.remaining() - self.settings.deadline_margin_ms / 1000
+        max_tokens = int(timeout * self.settings.deadline_tokens_per_second)
+        return timeout, max(0, min(self.settings.openai_max_tokens, max_tokens))
+    
+    def _deadline_too_close(self, timeout: Optional[float], max_tokens: int) -> bool:
+        if timeout is None or max_tokens >= self.settings.deadline_min_tokens:
+            return False
+        self.metrics.fallbacks.inc("deadline")
+        logger.warning(f"Skipping OpenAI call, {timeout * 1000:.0f}ms left before the deadline")
+        return True
+    
+    def estimate_prompt_tokens(
+        self,
+        email_content: str,
+        conversation_history: List[Dict[str, str]] = None,
+        business_context: Dict[str, Any] = None
+    ) -> int:
+        """Approximate prompt size at four characters per token"""
+        prompt_chars = self._system_prompt_chars + len(email_content) + 32
+        if conversation_history:
+            prompt_chars += sum(len(msg.get("content", "")) for msg in conversation_history[-5:])
+        if business_context:
+            prompt_chars += len(str(business_context))
+        return prompt_chars // 4
         
     async def generate_email_response(
         self,
@@ -27,7 +124,8 @@ class OpenAIService:
         tone: str = "professional",
         industry: str = "hospitality",
         language: str = "auto",
-        business_context: Dict[str, Any] = None
+        business_context: Dict[str, Any] = None,
+        model: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Generate intelligent email response using OpenAI
@@ -39,54 +137,331 @@ class OpenAIService:
             industry: Business industry (hospitality, real_estate, tourism)
             language: Response language (auto, es, en)
             business_context: Additional business information
+            model: Model override (e.g. a budget downgrade); defaults to the
+                endpoint's model, then ``settings.openai_model``
             
         Returns:
             Dict containing generated response and metadata
         """
         try:
-            # Build system prompt
-            system_prompt = self._build_system_prompt(tone, industry, language, business_context)
+            with span("prompt_build"):
+                # Build system prompt
+                system_prompt = self._get_system_prompt(tone, industry, language, business_context)
+                
+                # Build conversation context
+                messages = self._build_conversation_context(
+                    email_content, conversation_history, system_prompt
+                )
             
-            # Build conversation context
-            messages = self._build_conversation_context(
-                email_content, conversation_history, system_prompt
-            )
+            timeout, max_tokens = self._request_budget()
+            if self._deadline_too_close(timeout, max_tokens):
+                return self._failure_result(tone, industry, language, "Deadline exceeded")
+            
+            # Shed the call rather than pile up behind a slow upstream
+            admitted = self.limiter.try_acquire()
+            if admitted is None:
+                self.metrics.fallbacks.inc("openai_shed")
+                return self._failure_result(tone, industry, language, "OpenAI concurrency limit reached")
             
             # Generate response
-            response = await self.client.chat.completions.create(
-                model=self.settings.openai_model,
-                messages=messages,
-                max_tokens=self.settings.openai_max_tokens,
-                temperature=self.settings.openai_temperature,
-                presence_penalty=0.1,
-                frequency_penalty=0.1
+            expires_at = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+            started = time.perf_counter()
+            overloaded = False
+            cancelled = False
+            expired = False
+            try:
+                with span("openai_call"):
+                    # The SDK timeout bounds each attempt; the deadline
+                    # bounds retries and failovers as well
+                    response, upstream, upstream_started, model = await self._create(
+                        model,
+                        expires_at,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=self.settings.openai_temperature,
+                        presence_penalty=0.1,
+                        frequency_penalty=0.1,
+                        **_timeout_option(timeout, self.settings)
+                    )
+                    self.pool.finish(upstream, upstream_started)
+            except asyncio.CancelledError:
+                # Cancelling the await closes the upstream connection, which
+                # stops generation; the latency says nothing about capacity
+                cancelled = True
+                raise
+            except TimeoutError:
+                # Our deadline rather than an upstream timeout
+                expired = True
+            except Exception as e:
+                if not _is_deadline_timeout(e, expires_at):
+                    overloaded = _is_overload(e)
+                    raise
+                expired = True
+            finally:
+                self.limiter.release(admitted, overloaded, sample=not (cancelled or expired))
+            latency_ms = (time.perf_counter() - started) * 1000
+            if expired:
+                self.metrics.fallbacks.inc("deadline")
+                logger.warning(f"OpenAI call abandoned at the request deadline after {latency_ms:.0f}ms")
+                return self._failure_result(tone, industry, language, "Deadline exceeded")
+            
+            usage = response.usage
+            prompt_details = getattr(usage, "prompt_tokens_details", None)
+            return self._success_result(
+                response.choices[0].message.content, tone, industry, language, model,
+                usage.prompt_tokens,
+                usage.completion_tokens,
+                getattr(prompt_details, "cached_tokens", None) or 0,
+                latency_ms
             )
             
-            generated_text = response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            self.metrics.fallbacks.inc("openai_error")
+            return self._failure_result(tone, industry, language, str(e))
+    
+    async def stream_email_response(
+        self,
+        email_content: str,
+        conversation_history: List[Dict[str, str]] = None,
+        tone: str = "professional",
+        industry: str = "hospitality",
+        language: str = "auto",
+        business_context: Dict[str, Any] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[Union[str, Dict[str, Any]]]:
+        """
+        Stream an email response from OpenAI as it is generated
+        
+        Yields text deltas as they arrive, then one final result dict in the
+        same shape ``generate_email_response`` returns. A failure yields only
+        the fallback result, which may follow deltas already sent. Closing
+        the generator early (or cancelling the consumer) closes the upstream
+        stream, which stops generation.
+        """
+        try:
+            with span("prompt_build"):
+                system_prompt = self._get_system_prompt(tone, industry, language, business_context)
+                messages = self._build_conversation_context(
+                    email_content, conversation_history, system_prompt
+                )
             
-            # Detect language if auto
-            detected_language = self._detect_language(generated_text) if language == "auto" else language
+            timeout, max_tokens = self._request_budget()
+            if self._deadline_too_close(timeout, max_tokens):
+                yield self._failure_result(tone, industry, language, "Deadline exceeded")
+                return
             
-            return {
-                "response": generated_text,
-                "tone": tone,
-                "industry": industry,
-                "language": detected_language,
-                "tokens_used": response.usage.total_tokens,
-                "model": self.settings.openai_model,
-                "success": True
-            }
+            admitted = self.limiter.try_acquire()
+            if admitted is None:
+                self.metrics.fallbacks.inc("openai_shed")
+                yield self._failure_result(tone, industry, language, "OpenAI concurrency limit reached")
+                return
+            
+            # The deadline is applied per await; a timeout scope must not
+            # stay open across a yield
+            expires_at = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+            started = time.perf_counter()
+            overloaded = False
+            completed = False
+            expired = False
+            failed = False
+            stream = None
+            usage = None
+            chunks = []
+            try:
+                with span("openai_call"):
+                    stream, upstream, upstream_started, model = await self._create(
+                        model,
+                        expires_at,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=self.settings.openai_temperature,
+                        presence_penalty=0.1,
+                        frequency_penalty=0.1,
+                        stream=True,
+                        extra_body={"stream_options": {"include_usage": True}} if self.settings.openai_stream_usage else None,
+                        **_timeout_option(timeout, self.settings)
+                    )
+                chunk_iterator = stream.__aiter__()
+                while True:
+                    async with asyncio.timeout_at(expires_at):
+                        try:
+                            chunk = await chunk_iterator.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    usage = getattr(chunk, "usage", None) or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        chunks.append(delta)
+                        yield delta
+                completed = True
+            except TimeoutError:
+                expired = True
+            except Exception as e:
+                if not _is_deadline_timeout(e, expires_at):
+                    overloaded = _is_overload(e)
+                    failed = True
+                    raise
+                expired = True
+            finally:
+                # Stream duration includes the client's own backpressure, so
+                # only an overloaded upstream is fed to the limiter
+                self.limiter.release(admitted, overloaded, sample=overloaded)
+                if stream is not None:
+                    # A stream that broke off or stalled until the deadline
+                    # is the endpoint's failure; one closed by our caller is
+                    # not. Stream duration depends on the reply length, so
+                    # it is not used for endpoint latency
+                    self.pool.finish(
+                        upstream, upstream_started,
+                        failed=failed or expired,
+                        cancelled=not (completed or failed or expired),
+                        sample=False
+                    )
+                    if not completed:
+                        await stream.response.aclose()
+            latency_ms = (time.perf_counter() - started) * 1000
+            if expired:
+                self.metrics.fallbacks.inc("deadline")
+                logger.warning(f"OpenAI stream abandoned at the request deadline after {latency_ms:.0f}ms")
+                yield self._failure_result(tone, industry, language, "Deadline exceeded")
+                return
+            
+            text = "".join(chunks)
+            if usage is None:
+                # Upstream did not report usage for the stream; estimate it
+                prompt_tokens = self.estimate_prompt_tokens(email_content, conversation_history, business_context)
+                completion_tokens = len(text) // 4
+                cached_tokens = 0
+            else:
+                usage = _as_dict(usage)
+                prompt_tokens = usage.get("prompt_tokens", 0)
+                completion_tokens = usage.get("completion_tokens", 0)
+                cached_tokens = _as_dict(usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+            yield self._success_result(
+                text, tone, industry, language, model,
+                prompt_tokens, completion_tokens, cached_tokens, latency_ms
+            )
             
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
-            return {
-                "response": self._get_fallback_response(tone, language),
-                "tone": tone,
-                "industry": industry,
-                "language": language,
-                "error": str(e),
-                "success": False
-            }
+            self.metrics.fallbacks.inc("openai_error")
+            yield self._failure_result(tone, industry, language, str(e))
+    
+    async def _create(
+        self,
+        model: Optional[str],
+        expires_at: Optional[float] = None,
+        **params
+    ) -> Tuple[Any, Upstream, float, str]:
+        """Create a completion on the best endpoint, failing over on endpoint errors
+        
+        A ``model`` passed by the caller (a budget downgrade) is used on every
+        endpoint; otherwise the endpoint's own model applies, then
+        ``settings.openai_model``. Returns the SDK result with the endpoint it
+        came from, the start time to pass to ``pool.finish`` once the caller
+        is done with it, and the model that was requested.
+        
+        Attempts stop at ``expires_at`` (event loop time) with
+        ``TimeoutError``; an endpoint that has not answered by then counts as
+        failed, so one that hangs is ejected like one that errors.
+        """
+        tried: List[Upstream] = []
+        upstream = self.pool.select()
+        while True:
+            started = self.pool.start(upstream)
+            try:
+                used_model = model or upstream.model or self.settings.openai_model
+                async with asyncio.timeout_at(expires_at):
+                    result = await upstream.client.chat.completions.create(model=used_model, **params)
+                return result, upstream, started, used_model
+            except asyncio.CancelledError:
+                # The caller gave up (e.g. the client disconnected)
+                self.pool.finish(upstream, started, cancelled=True)
+                raise
+            except Exception as e:
+                failed = isinstance(e, TimeoutError) or _is_endpoint_failure(e)
+                self.pool.finish(upstream, started, failed=failed, sample=False)
+                tried.append(upstream)
+                fallback = None
+                if failed and not _deadline_reached(expires_at) and len(tried) <= self.settings.openai_failover_attempts:
+                    fallback = self.pool.select(tried)
+                if fallback is None:
+                    raise
+                logger.warning(f"OpenAI upstream {upstream.name} failed ({str(e)}), retrying on {fallback.name}")
+                self.pool.failovers.inc(upstream.name)
+                upstream = fallback
+    
+    def _success_result(
+        self,
+        text: str,
+        tone: str,
+        industry: str,
+        language: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        latency_ms: float
+    ) -> Dict[str, Any]:
+        """Result of a completed generation, counting its tokens"""
+        self.metrics.openai_tokens.inc(model, "prompt", amount=prompt_tokens)
+        self.metrics.openai_tokens.inc(model, "completion", amount=completion_tokens)
+        if cached_tokens:
+            self.metrics.openai_tokens.inc(model, "cached", amount=cached_tokens)
+        
+        # Detect language if auto
+        detected_language = self._detect_language(text) if language == "auto" else language
+        
+        return {
+            "response": text,
+            "tone": tone,
+            "industry": industry,
+            "language": detected_language,
+            "tokens_used": prompt_tokens + completion_tokens,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "model": model,
+            "latency_ms": latency_ms,
+            "success": True
+        }
+    
+    def _failure_result(self, tone: str, industry: str, language: str, error: str) -> Dict[str, Any]:
+        """Fallback result returned when no completion was generated"""
+        return {
+            "response": self._get_fallback_response(tone, language),
+            "tone": tone,
+            "industry": industry,
+            "language": language,
+            "error": error,
+            "success": False
+        }
+    
+    def _get_system_prompt(
+        self,
+        tone: str,
+        industry: str,
+        language: str,
+        business_context: Dict[str, Any] = None
+    ) -> str:
+        """Rendered system prompt, memoized by the fields it depends on"""
+        key = (tone, industry, language)
+        if business_context:
+            key += tuple(
+                repr(business_context[field]) if field in business_context else None
+                for field in ("name", "location", "specialties")
+            )
+        
+        prompt = self._system_prompts.get(key)
+        self.metrics.record_cache("system_prompt", prompt is not None)
+        if prompt is None:
+            if len(self._system_prompts) >= 1024:
+                self._system_prompts.clear()
+            prompt = self._system_prompts[key] = self._build_system_prompt(
+                tone, industry, language, business_context
+            )
+        return prompt
     
     def _build_system_prompt(
         self, 
@@ -199,8 +574,120 @@ IMPORTANT GUIDELINES:
         
         return fallbacks.get(language, fallbacks["en"]).get(tone, fallbacks["en"]["professional"])
 
+def _is_overload(error: Exception) -> bool:
+    """Whether an OpenAI error signals upstream overload (429 or timeout)"""
+    import openai
+    
+    return isinstance(error, (openai.RateLimitError, openai.APITimeoutError))
+
+_http_client = None
+
+def get_http_client():
+    """Process-wide HTTP client whose connection pool all OpenAI calls share
+    
+    Pool size, keep-alive and timeouts come from settings. HTTP/2 needs the
+    optional ``h2`` package and falls back to HTTP/1.1 without it.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = build_http_client(get_settings())
+    return _http_client
+
+def build_http_client(settings):
+    """HTTP client with the pool size, keep-alive and timeouts from settings"""
+    import httpx
+    
+    http2 = settings.openai_http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("OPENAI_HTTP2 is enabled but h2 is not installed; using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections,
+            keepalive_expiry=settings.openai_keepalive_expiry
+        ),
+        timeout=httpx.Timeout(
+            settings.openai_timeout,
+            connect=settings.openai_connect_timeout,
+            pool=settings.openai_pool_timeout
+        )
+    )
+
+async def close_http_client():
+    """Close pooled connections on shutdown"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def _deadline_reached(expires_at: Optional[float]) -> bool:
+    """Whether the event loop time has reached ``expires_at``, allowing for timer slack"""
+    return expires_at is not None and asyncio.get_running_loop().time() >= expires_at - 0.01
+
+def _is_deadline_timeout(error: Exception, expires_at: Optional[float]) -> bool:
+    """Whether an SDK timeout is the request deadline running out
+    
+    The SDK timeout is shortened to the time left, so such a timeout says
+    nothing about upstream overload.
+    """
+    import openai
+    
+    return isinstance(error, openai.APITimeoutError) and _deadline_reached(expires_at)
+
+def _timeout_option(timeout: Optional[float], settings) -> Dict[str, Any]:
+    """Per-request SDK timeout, leaving the client default when there is no deadline
+    
+    The remaining budget only ever shortens the configured timeouts, so a
+    stuck connect or pool wait still fails fast instead of using it all.
+    """
+    if timeout is None:
+        return {}
+    import httpx
+    
+    timeout = max(timeout, 0.0)
+    return {"timeout": httpx.Timeout(
+        min(timeout, settings.openai_timeout),
+        connect=min(timeout, settings.openai_connect_timeout),
+        pool=min(timeout, settings.openai_pool_timeout)
+    )}
+
+def _as_dict(value: Any) -> Dict[str, Any]:
+    """Fields the SDK does not model yet arrive as plain dicts"""
+    if isinstance(value, dict):
+        return value
+    return value.model_dump() if hasattr(value, "model_dump") else vars(value)
+
+def _is_endpoint_failure(error: Exception) -> bool:
+    """Whether an error is the endpoint's fault and another endpoint may succeed
+    
+    Connection errors, timeouts, 5xx, 429 and auth errors are; a request the
+    API rejects as invalid would fail everywhere.
+    """
+    import openai
+    
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code not in (400, 413, 422)
+    return isinstance(error, openai.APIConnectionError)
+
 # Singleton instance
-@lru_cache()
+_openai_service = None
+_openai_service_lock = threading.Lock()
+
 def get_openai_service() -> OpenAIService:
-    """Get cached OpenAI service instance"""
-    return OpenAIService()
\ No newline at end of file
+    """Get OpenAI service instance
+    
+    The warm-up builds services in a worker thread while a request may build
+    them on the event loop, so construction is locked; the loser of the race
+    waits for the instance instead of building a second one.
+    """
+    global _openai_service
+    if _openai_service is None:
+        with _openai_service_lock:
+            if _openai_service is None:
+                _openai_service = OpenAIService()
+    return _openai_service
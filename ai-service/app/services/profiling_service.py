@@ -0,0 +1,165 @@
+"""
+Opt-in statistical profiler for production requests
+"""
+
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Any
+
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack while profiled requests are in flight
+
+    Stacks are aggregated in memory and periodically written to
+    ``settings.profiling_dir`` in the collapsed ("folded") format read by
+    flamegraph.pl, speedscope and inferno. Because requests share the event
+    loop, samples cover everything the loop runs while a profiled request is
+    active, not only that request.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.interval = self.settings.profiling_interval_ms / 1000
+        self._stacks: Counter = Counter()
+        self._active = 0
+        self._target_thread: Optional[int] = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._last_flush = time.monotonic()
+        self.samples_taken = 0
+        self.profiles_written = 0
+
+    def should_profile(self, headers: Dict[bytes, bytes]) -> bool:
+        """Profile when the debug header carries the profiling token or the request is sampled
+
+        Without a ``profiling_token`` configured the header is ignored, so
+        clients cannot switch the profiler on by themselves.
+        """
+        token = self.settings.profiling_token
+        value = headers.get(self.settings.profiling_header.lower().encode("latin-1"))
+        if token and value is not None and hmac.compare_digest(value, token.encode()):
+            return True
+        return random.random() < self.settings.profiling_sample_rate
+
+    def start_request(self):
+        """Mark a profiled request as in flight (called on the event loop thread)"""
+        with self._lock:
+            self._target_thread = threading.get_ident()
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end_request(self):
+        with self._lock:
+            self._active -= 1
+            if not self._active:
+                self._wake.clear()
+
+    def _run(self):
+        while not self._stopping:
+            if not self._wake.wait(timeout=self.settings.profiling_flush_seconds):
+                self._maybe_flush()
+                continue
+            frame = sys._current_frames().get(self._target_thread)
+            if frame is not None:
+                self._stacks[self._collapse(frame)] += 1
+                self.samples_taken += 1
+            self._maybe_flush()
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":"))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.settings.profiling_flush_seconds:
+            self.flush()
+
+    def flush(self) -> Optional[str]:
+        """Write aggregated stacks to a new folded-stack file and reset them"""
+        self._last_flush = time.monotonic()
+        with self._lock:
+            stacks, self._stacks = self._stacks, Counter()
+        if not stacks:
+            return None
+
+        os.makedirs(self.settings.profiling_dir, exist_ok=True)
+        path = os.path.join(
+            self.settings.profiling_dir,
+            f"profile-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}.folded"
+        )
+        with open(path, "w", encoding="utf-8") as profile_file:
+            for stack, count in stacks.most_common():
+                profile_file.write(f"{stack} {count}\n")
+        self.profiles_written += 1
+        logger.info(f"Wrote profile with {sum(stacks.values())} samples to {path}")
+        return path
+
+    def close(self):
+        """Stop sampling and write any pending samples"""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active_requests": self._active,
+            "samples_taken": self.samples_taken,
+            "profiles_written": self.profiles_written
+        }
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling sampled or explicitly flagged /chat requests
+
+    Only installed when ``settings.profiling_enabled`` is set, so disabled
+    profiling adds nothing to the request path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.profiler = get_profiler()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"] != "/chat"
+            or not self.profiler.should_profile(dict(scope["headers"]))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        self.profiler.start_request()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.end_request()
+
+# Singleton instance
+_profiler = None
+
+def get_profiler() -> SamplingProfiler:
+    """Get sampling profiler instance"""
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler()
+    return _profiler
@@ -0,0 +1,204 @@
+"""
+Streaming quantile sketches for latency and token distributions
+"""
+
+import logging
+import threading
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+class QuantileSketch:
+    """Mergeable log-bucketed quantile sketch (DDSketch)
+
+    Every positive value falls into bucket ``ceil(log(value) / log(gamma))``,
+    so any reported quantile is within ``relative_accuracy`` of a real
+    sample. Memory is bounded by the logarithm of the value range.
+    """
+
+    __slots__ = ("gamma", "_log_gamma", "buckets", "zero_count", "count", "total", "min", "max")
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        """Add a non-negative sample"""
+        if value > 1e-9:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "QuantileSketch"):
+        """Fold another sketch with the same accuracy into this one"""
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate value at quantile q in [0, 1]"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def clear(self):
+        self.buckets.clear()
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+class WindowedSketch:
+    """Ring of per-interval sketches queried over a sliding window"""
+
+    __slots__ = ("interval", "_slots", "_sketches")
+
+    def __init__(self, window_seconds: int, interval_seconds: int, relative_accuracy: float):
+        self.interval = interval_seconds
+        size = max(1, math.ceil(window_seconds / interval_seconds))
+        self._slots: List[int] = [-1] * size
+        self._sketches = [QuantileSketch(relative_accuracy) for _ in range(size)]
+
+    def add(self, value: float, now: float):
+        slot = int(now // self.interval)
+        position = slot % len(self._slots)
+        if self._slots[position] != slot:
+            self._slots[position] = slot
+            self._sketches[position].clear()
+        self._sketches[position].add(value)
+
+    def merge_into(self, target: QuantileSketch, window_seconds: float, now: float):
+        """Merge the sub-sketches that fall within the last window_seconds"""
+        oldest = int((now - window_seconds) // self.interval)
+        for slot, sketch in zip(self._slots, self._sketches):
+            if slot > oldest and sketch.count:
+                target.merge(sketch)
+
+class QuantileService:
+    """Per endpoint, model and business quantile sketches
+
+    Series are keyed by ``(metric, endpoint, model, business_id)``. The
+    number of series is capped; the least recently updated one is evicted
+    when a new series would exceed the cap.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._series: "OrderedDict[Tuple[str, str, str, str], WindowedSketch]" = OrderedDict()
+
+    def record(
+        self,
+        metric: str,
+        value: float,
+        endpoint: str = "chat",
+        model: Optional[str] = None,
+        business_id: Optional[str] = None
+    ):
+        """Record a sample, e.g. ``record("openai_latency_ms", 812.5, model="gpt-4")``"""
+        key = (metric, endpoint, model or "", business_id or "")
+        series = self._series.get(key)
+        if series is None:
+            if len(self._series) >= self.settings.quantile_max_series:
+                self._series.popitem(last=False)
+            series = self._series[key] = WindowedSketch(
+                self.settings.quantile_window_seconds,
+                self.settings.quantile_interval_seconds,
+                self.settings.quantile_relative_accuracy
+            )
+        else:
+            self._series.move_to_end(key)
+        series.add(value, time.time())
+
+    def get_percentiles(
+        self,
+        metric: str,
+        window_seconds: Optional[int] = None,
+        endpoint: Optional[str] = None,
+        model: Optional[str] = None,
+        business_id: Optional[str] = None,
+        quantiles: Iterable[float] = DEFAULT_QUANTILES
+    ) -> Dict[str, Any]:
+        """Percentiles of a metric over a window, merged across matching series"""
+        window_seconds = min(
+            window_seconds or self.settings.quantile_window_seconds,
+            self.settings.quantile_window_seconds
+        )
+        merged = QuantileSketch(self.settings.quantile_relative_accuracy)
+        now = time.time()
+        for (name, series_endpoint, series_model, series_business), series in self._series.items():
+            if name != metric:
+                continue
+            if endpoint is not None and series_endpoint != endpoint:
+                continue
+            if model is not None and series_model != model:
+                continue
+            if business_id is not None and series_business != business_id:
+                continue
+            series.merge_into(merged, window_seconds, now)
+
+        return {
+            "metric": metric,
+            "window_seconds": window_seconds,
+            "count": merged.count,
+            "mean": round(merged.total / merged.count, 3) if merged.count else None,
+            "min": round(merged.min, 3) if merged.count else None,
+            "max": round(merged.max, 3) if merged.count else None,
+            "percentiles": {
+                f"p{q * 100:g}": (round(value, 3) if (value := merged.quantile(q)) is not None else None)
+                for q in quantiles
+            }
+        }
+
+    def series_count(self) -> int:
+        return len(self._series)
+
+    def get_metrics(self) -> List[str]:
+        """Names of metrics with at least one series"""
+        return sorted({key[0] for key in self._series})
+
+# Singleton instance
+_quantile_service = None
+_quantile_service_lock = threading.Lock()
+
+def get_quantile_service() -> QuantileService:
+    """Get quantile service instance"""
+    global _quantile_service
+    if _quantile_service is None:
+        with _quantile_service_lock:
+            if _quantile_service is None:
+                _quantile_service = QuantileService()
+    return _quantile_service
@@ -0,0 +1,101 @@
+"""
+Background pipeline for post-response bookkeeping
+"""
+
+import asyncio
+import contextvars
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Set, Tuple
+
+from config.settings import get_settings
+from app.services.metrics_service import get_metrics_service
+
+logger = logging.getLogger(__name__)
+
+class TaskPipeline:
+    """Runs synchronous bookkeeping jobs after the response has been sent
+
+    Jobs submitted under the same key (a conversation id) run one at a time
+    in submission order; different keys are independent. Each key with
+    pending jobs has one runner task, which yields to the event loop before
+    every job. Runners start from an empty context, so request-scoped state
+    (trace, deadline) of the request that submitted a job does not apply to
+    it. ``drain`` waits for all pending jobs on graceful shutdown; after that
+    a job runs inline unless its key still has jobs queued.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._queues: Dict[str, Deque[Tuple[Callable, tuple]]] = {}
+        self._runners: Set[asyncio.Task] = set()
+        self._closing = False
+        self.pending = 0
+
+        metrics = get_metrics_service()
+        self.jobs = metrics.counter(
+            "caboai_background_jobs_total", "Background bookkeeping jobs by result", ("result",)
+        )
+        metrics.gauge(
+            "caboai_background_jobs_pending", "Background bookkeeping jobs waiting to run",
+            lambda: self.pending
+        )
+
+    def submit(self, key: str, job: Callable, *args):
+        """Queue ``job(*args)`` behind earlier jobs for the same key"""
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Also while closing: the key's runner is still being drained
+            self.pending += 1
+            queue.append((job, args))
+            return
+        if self._closing:
+            self._run(job, args)
+            return
+
+        self.pending += 1
+        self._queues[key] = deque([(job, args)])
+        runner = asyncio.get_running_loop().create_task(self._drain_key(key), context=contextvars.Context())
+        self._runners.add(runner)
+        runner.add_done_callback(self._runners.discard)
+
+    async def _drain_key(self, key: str):
+        queue = self._queues[key]
+        try:
+            while queue:
+                await asyncio.sleep(0)
+                job, args = queue.popleft()
+                self.pending -= 1
+                self._run(job, args)
+        finally:
+            del self._queues[key]
+
+    def _run(self, job: Callable, args: tuple):
+        try:
+            job(*args)
+            self.jobs.inc("ok")
+        except Exception as e:
+            self.jobs.inc("error")
+            logger.error(f"Background job {getattr(job, '__name__', job)} failed: {str(e)}", exc_info=True)
+
+    async def drain(self):
+        """Finish pending jobs before shutdown; later submissions run inline"""
+        self._closing = True
+        if not self._runners:
+            return
+        timeout = self.settings.background_drain_timeout
+        done, pending = await asyncio.wait(set(self._runners), timeout=timeout)
+        if pending:
+            logger.error(f"{self.pending} background jobs still pending after {timeout}s")
+        else:
+            logger.info(f"Drained background jobs from {len(done)} conversations")
+
+# Singleton instance
+_task_pipeline = None
+
+def get_task_pipeline() -> TaskPipeline:
+    """Get background task pipeline instance"""
+    global _task_pipeline
+    if _task_pipeline is None:
+        _task_pipeline = TaskPipeline()
+    return _task_pipeline
@@ -0,0 +1,160 @@
+"""
+Lightweight per-request span timing, Server-Timing headers and sampled traces
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Any, Tuple
+from uuid import uuid4
+
+from config.settings import get_settings
+from app.services.metrics_service import get_metrics_service
+
+logger = logging.getLogger(__name__)
+
+class RequestTrace:
+    """Spans recorded while handling one request"""
+
+    __slots__ = ("method", "path", "started", "timestamp", "spans", "sampled")
+
+    def __init__(self, method: str, path: str, sampled: bool):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.spans: List[Tuple[str, float, float]] = []  # (name, offset, duration) in seconds
+        self.sampled = sampled
+
+    def server_timing(self) -> str:
+        """Server-Timing header value; repeated span names are summed"""
+        totals: Dict[str, float] = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        totals["total"] = time.perf_counter() - self.started
+        return ", ".join(f"{name};dur={duration * 1000:.2f}" for name, duration in totals.items())
+
+    def to_record(self, status: int) -> Dict[str, Any]:
+        return {
+            "trace_id": uuid4().hex,
+            "timestamp": self.timestamp,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "spans": [
+                {"name": name, "offset_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                for name, offset, duration in self.spans
+            ]
+        }
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("caboai_request_trace", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    """Trace of the request being handled, if any"""
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str):
+    """Time a block as a pipeline stage
+
+    The duration is always observed in the stage latency histogram and, inside
+    a traced request, appended to the request's spans.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        get_metrics_service().stage_duration.observe(duration, name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, started - trace.started, duration))
+
+class TraceWriter:
+    """Appends sampled trace records as JSON lines from a background thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put(record)
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as trace_file:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                trace_file.write(json.dumps(record) + "\n")
+                if self._queue.empty():
+                    trace_file.flush()
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+# Singleton instance
+_trace_writer = None
+
+def get_trace_writer() -> Optional[TraceWriter]:
+    """Get the trace writer, or None when no trace file is configured"""
+    global _trace_writer
+    if _trace_writer is None and get_settings().trace_file:
+        _trace_writer = TraceWriter(get_settings().trace_file)
+    return _trace_writer
+
+class TracingMiddleware:
+    """ASGI middleware adding Server-Timing headers and sampled trace records"""
+
+    def __init__(self, app):
+        self.app = app
+        self.settings = get_settings()
+        self.writer = get_trace_writer()
+
+    async def __call__(self, scope, receive, send):
+        settings = self.settings
+        if scope["type"] != "http" or not (settings.server_timing_enabled or settings.trace_sample_rate > 0):
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.writer is not None and random.random() < settings.trace_sample_rate
+        trace = RequestTrace(scope["method"], scope["path"], sampled)
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.server_timing_enabled:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            if sampled:
+                self.writer.write(trace.to_record(status))
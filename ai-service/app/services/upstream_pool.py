@@ -0,0 +1,207 @@
+"""
+Load balancing across OpenAI-compatible endpoints with ejection of failing ones
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.services.metrics_service import get_metrics_service
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("least_outstanding", "ewma")
+
+class Upstream:
+    """One OpenAI-compatible endpoint and its load and health state"""
+
+    def __init__(self, name: str, client: Any, model: Optional[str] = None, weight: float = 1.0):
+        self.name = name
+        self.client = client
+        self.model = model  # default model here, e.g. a gateway's deployment name
+        self.weight = weight
+        self.outstanding = 0
+        self.ewma: Optional[float] = None  # seconds
+        self.last_sample = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def get_stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            "ejected": not self.available(now),
+            "ejections": self.ejections,
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+class UpstreamPool:
+    """Picks an endpoint per request and ejects endpoints that keep failing
+
+    ``least_outstanding`` picks the endpoint with the fewest requests in
+    flight relative to its weight. ``ewma`` (peak EWMA) multiplies that by
+    the endpoint's moving average latency, so a slow endpoint gets less
+    traffic before it fails outright; endpoints without samples yet count as
+    the fastest. Ties go to the endpoint that has waited longest.
+
+    ``eject_failures`` consecutive failures eject an endpoint for
+    ``eject_seconds``, doubling with each repeated ejection up to eight times
+    as long. Once the time is up it gets traffic again, and its next failure
+    ejects it straight away. A success or a passing health probe resets it.
+    If every endpoint is ejected, requests go to all of them anyway rather
+    than failing outright.
+    """
+
+    def __init__(
+        self,
+        upstreams: Sequence[Upstream],
+        strategy: str = "least_outstanding",
+        eject_failures: int = 3,
+        eject_seconds: float = 30.0,
+        decay_seconds: float = 10.0
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy {strategy!r}, expected one of {STRATEGIES}")
+        self.upstreams: List[Upstream] = list(upstreams)
+        self.strategy = strategy
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.decay_seconds = decay_seconds
+        self._last_picked: Dict[str, float] = {upstream.name: 0.0 for upstream in self.upstreams}
+
+        metrics = get_metrics_service()
+        self.requests = metrics.counter(
+            "caboai_upstream_requests_total", "OpenAI requests per upstream endpoint and result", ("upstream", "result")
+        )
+        self.failovers = metrics.counter(
+            "caboai_upstream_failovers_total", "OpenAI requests retried on another endpoint", ("upstream",)
+        )
+        metrics.gauge(
+            "caboai_upstream_outstanding", "OpenAI requests in flight per upstream endpoint",
+            lambda: {(upstream.name,): upstream.outstanding for upstream in self.upstreams},
+            ("upstream",)
+        )
+        metrics.gauge(
+            "caboai_upstream_ejected", "Whether an upstream endpoint is ejected (1) or in rotation (0)",
+            lambda: {
+                (upstream.name,): int(not upstream.available(time.monotonic())) for upstream in self.upstreams
+            },
+            ("upstream",)
+        )
+
+    def select(self, exclude: Sequence[Upstream] = ()) -> Optional[Upstream]:
+        """Endpoint for the next request, or None when all are excluded"""
+        candidates = [upstream for upstream in self.upstreams if upstream not in exclude]
+        now = time.monotonic()
+        available = [upstream for upstream in candidates if upstream.available(now)]
+        if not available:
+            available = candidates
+        if not available:
+            return None
+
+        if len(available) == 1:
+            chosen = available[0]
+        else:
+            chosen = min(available, key=lambda upstream: (self._cost(upstream), self._last_picked[upstream.name]))
+        self._last_picked[chosen.name] = now
+        return chosen
+
+    def _cost(self, upstream: Upstream) -> float:
+        load = (upstream.outstanding + 1) / upstream.weight
+        if self.strategy == "ewma":
+            return load * (upstream.ewma or 0.0)
+        return load
+
+    def start(self, upstream: Upstream) -> float:
+        """Count a request against ``upstream``; returns its start time"""
+        upstream.outstanding += 1
+        upstream.requests += 1
+        return time.monotonic()
+
+    def finish(
+        self,
+        upstream: Upstream,
+        started: float,
+        failed: bool = False,
+        sample: bool = True,
+        cancelled: bool = False
+    ):
+        """Finish a request started at ``started``
+
+        ``failed`` marks an endpoint failure (connection error, 5xx, 429,
+        auth, no answer by the deadline); ``cancelled`` a request the caller
+        gave up on, which says nothing about the endpoint's health either
+        way; ``sample=False`` leaves the latency average alone, e.g. for
+        streams.
+        """
+        upstream.outstanding -= 1
+        now = time.monotonic()
+        if cancelled:
+            self.requests.inc(upstream.name, "cancelled")
+            return
+        if failed:
+            self.requests.inc(upstream.name, "error")
+            upstream.failures += 1
+            upstream.consecutive_failures += 1
+            if upstream.consecutive_failures >= self.eject_failures and upstream.available(now):
+                self._eject(upstream, now)
+            return
+
+        self.requests.inc(upstream.name, "ok")
+        self._restore(upstream)
+        if sample:
+            latency = now - started
+            if upstream.ewma is None:
+                upstream.ewma = latency
+            else:
+                # Time-decayed average; a latency spike is taken at once
+                weight = min(1.0, (now - upstream.last_sample) / self.decay_seconds)
+                upstream.ewma = max(latency, upstream.ewma * (1 - weight) + latency * weight)
+            upstream.last_sample = now
+
+    def _eject(self, upstream: Upstream, now: float):
+        duration = self.eject_seconds * 2 ** min(upstream.ejections, 3)
+        upstream.ejected_until = now + duration
+        upstream.ejections += 1
+        logger.warning(
+            f"Ejected OpenAI upstream {upstream.name} for {duration:.0f}s "
+            f"after {upstream.consecutive_failures} consecutive failures"
+        )
+
+    def _restore(self, upstream: Upstream):
+        if upstream.consecutive_failures >= self.eject_failures:
+            logger.info(f"OpenAI upstream {upstream.name} is healthy again")
+            upstream.ejections = 0
+        upstream.consecutive_failures = 0
+        upstream.ejected_until = 0.0
+
+    async def probe(self, check: Callable[[Upstream], Any]) -> Dict[str, Optional[str]]:
+        """Run ``check`` against every endpoint, ejected ones included
+
+        A passing check brings an ejected endpoint back into rotation. A
+        failing one is only reported, since not every gateway implements
+        the endpoint a probe uses. Returns the error per endpoint (None when
+        it passed).
+        """
+        async def probe_one(upstream: Upstream) -> Optional[str]:
+            try:
+                await check(upstream)
+            except Exception as e:
+                return str(e) or type(e).__name__
+            self._restore(upstream)
+            return None
+
+        errors = await asyncio.gather(*(probe_one(upstream) for upstream in self.upstreams))
+        return {upstream.name: error for upstream, error in zip(self.upstreams, errors)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {upstream.name: upstream.get_stats(now) for upstream in self.upstreams}
@@ -0,0 +1,275 @@
+"""
+Write-behind persistent ledger for usage records
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    user_id TEXT,
+    business_id TEXT,
+    endpoint TEXT NOT NULL,
+    model TEXT,
+    tokens INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL
+)
+"""
+
+_INSERT = """
+INSERT INTO usage_ledger (
+    timestamp, user_id, business_id, endpoint, model,
+    tokens, prompt_tokens, completion_tokens, cached_tokens, cost
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_STOP = object()
+
+class UsageLedger:
+    """Append-only SQLite ledger written by a background thread
+
+    ``append`` only enqueues a row, so recording usage never blocks the
+    event loop on disk I/O. The writer drains the queue in batches and
+    commits each batch in a single transaction (group commit).
+
+    A batch that fails to commit is retried with exponential backoff. After
+    ``retry_attempts`` failures it is appended to a JSON-lines spill file
+    next to the database, and spilled rows are imported again the next time
+    a ledger opens the database. Rows are only dropped if the spill file
+    cannot be written either; ``records_dropped`` counts them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        retry_attempts: int = 5,
+        retry_backoff: float = 0.1
+    ):
+        self.path = path
+        self.spill_path = f"{path}.spill.jsonl"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_attempts = retry_attempts
+        self.retry_backoff = retry_backoff
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Writer statistics
+        self.records_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+        self.records_spilled = 0
+        self.records_dropped = 0
+        self.records_recovered = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(_SCHEMA)
+            self._recover_spill(connection)
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _ensure_started(self):
+        # Started lazily so that the thread lives in the process that uses it
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None and not self._closed:
+                    self._thread = threading.Thread(
+                        target=self._run, name="usage-ledger-writer", daemon=True
+                    )
+                    self._thread.start()
+
+    def append(self, row: Tuple) -> None:
+        """Queue a row of (timestamp, user_id, business_id, endpoint, model,
+        tokens, prompt_tokens, completion_tokens, cached_tokens, cost)"""
+        if self._closed:
+            logger.warning("Usage ledger is closed; dropping record")
+            return
+        self._ensure_started()
+        self._queue.put(row)
+
+    def _run(self):
+        connection = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+
+                batch = []
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                if batch:
+                    self._write(connection, batch)
+        finally:
+            connection.close()
+
+    def _write(self, connection: sqlite3.Connection, batch: list):
+        delay = self.retry_backoff
+        for attempt in range(1, self.retry_attempts + 1):
+            started = time.perf_counter()
+            try:
+                with connection:
+                    connection.executemany(_INSERT, batch)
+                break
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                if attempt == self.retry_attempts:
+                    logger.error(
+                        f"Usage ledger write of {len(batch)} records failed {attempt} times, "
+                        f"spilling to {self.spill_path}: {str(e)}"
+                    )
+                    self._spill(batch)
+                    return
+                logger.warning(f"Usage ledger write of {len(batch)} records failed, retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+                delay *= 2
+
+        elapsed = time.perf_counter() - started
+        self.records_written += len(batch)
+        self.batches_written += 1
+        self.last_flush_seconds = elapsed
+        self.total_flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    def _spill(self, batch: list):
+        # One write per batch, so workers appending concurrently never
+        # interleave lines
+        data = "".join(json.dumps(list(row)) + "\n" for row in batch).encode()
+        try:
+            fd = os.open(self.spill_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self.records_spilled += len(batch)
+        except OSError as e:
+            self.records_dropped += len(batch)
+            logger.error(f"Usage ledger dropped {len(batch)} records; spill file failed: {str(e)}")
+
+    def _recover_spill(self, connection: sqlite3.Connection):
+        """Import rows spilled by an earlier writer, then remove the spill file"""
+        # Renaming first means only one of several workers imports the file
+        claimed = f"{self.spill_path}.{os.getpid()}"
+        try:
+            os.replace(self.spill_path, claimed)
+        except FileNotFoundError:
+            return
+        with open(claimed) as spill:
+            rows = [tuple(json.loads(line)) for line in spill if line.strip()]
+        with connection:
+            connection.executemany(_INSERT, rows)
+        os.remove(claimed)
+        self.records_recovered += len(rows)
+        logger.info(f"Recovered {len(rows)} spilled usage records into {self.path}")
+
+    def close(self, timeout: float = 10.0):
+        """Drain queued records to disk and stop the writer"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.error(f"Usage ledger did not drain within {timeout}s")
+        logger.info(f"Usage ledger closed after writing {self.records_written} records")
+
+    def replay(self, since: float) -> Iterator[Tuple]:
+        """Yield persisted rows newer than since, oldest first"""
+        connection = self._connect()
+        try:
+            yield from connection.execute(
+                "SELECT timestamp, user_id, business_id, endpoint, model, tokens, "
+                "prompt_tokens, completion_tokens, cached_tokens, cost "
+                "FROM usage_ledger WHERE timestamp > ? ORDER BY id",
+                (since,)
+            )
+        finally:
+            connection.close()
+
+    def replay_costs(self, since: float) -> Iterator[Tuple]:
+        """Yield (business_id, user_id, cost) for persisted rows newer than since"""
+        connection = self._connect()
+        try:
+            yield from connection.execute(
+                "SELECT business_id, user_id, cost FROM usage_ledger WHERE timestamp > ?",
+                (since,)
+            )
+        finally:
+            connection.close()
+
+    def spend_totals(self, since: float) -> Dict[str, float]:
+        """Total cost per ``business:<id>`` and ``user:<id>`` key since a timestamp"""
+        connection = self._connect()
+        try:
+            totals = {}
+            for column in ("business_id", "user_id"):
+                prefix = column.split("_")[0]
+                for key, cost in connection.execute(
+                    f"SELECT {column}, SUM(cost) FROM usage_ledger "
+                    f"WHERE timestamp > ? AND {column} IS NOT NULL GROUP BY {column}",
+                    (since,)
+                ):
+                    totals[f"{prefix}:{key}"] = cost
+            return totals
+        finally:
+            connection.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and flush latency of the writer"""
+        batches = self.batches_written
+        return {
+            "queue_depth": self._queue.qsize(),
+            "records_written": self.records_written,
+            "batches_written": batches,
+            "write_errors": self.write_errors,
+            "records_spilled": self.records_spilled,
+            "records_dropped": self.records_dropped,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 3),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+            "avg_flush_ms": round(self.total_flush_seconds / batches * 1000, 3) if batches else 0.0
+        }
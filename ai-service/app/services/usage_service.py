@@ -3,13 +3,20 @@ Usage tracking and rate limiting service
 """
 
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
+from zoneinfo import ZoneInfo
 from collections import defaultdict
 import asyncio
 
 from config.settings import get_settings
+from app.services.usage_store import ColumnarUsageStore
+from app.services.usage_ledger import UsageLedger
+from app.services.tracing_service import span
+from app.services.deadline import current_deadline
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +30,10 @@ class UsageRecord:
     cost_estimate: float
     timestamp: datetime
     metadata: Dict[str, Any] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    model: Optional[str] = None
 
 @dataclass
 class RateLimitInfo:
@@ -32,22 +43,98 @@ class RateLimitInfo:
     total_requests: int
     window_seconds: int
 
+@dataclass
+class Reservation:
+    """Admission decision for a request, settled once the request completes"""
+    allowed: bool
+    user_id: Optional[str]
+    business_id: Optional[str]
+    endpoint: str
+    rate_limit: RateLimitInfo
+    admitted_at: float  # monotonic seconds
+    estimated_tokens: int = 0
+    quota_keys: Tuple[str, ...] = ()
+    reserved_tokens: Tuple[int, ...] = ()  # tokens held against each quota key until settled
+    model: Optional[str] = None  # model override, e.g. a budget downgrade
+    error: Optional[str] = None
+    status_code: int = 429
+    settled: bool = False
+    
+    def rate_limit_dict(self) -> Dict[str, Any]:
+        """Rate limit state as returned to API callers"""
+        return {
+            "requests_remaining": self.rate_limit.requests_remaining,
+            "reset_time": self.rate_limit.reset_time.isoformat(),
+            "total_requests": self.rate_limit.total_requests
+        }
+
 class UsageTracker:
     """Track API usage and costs"""
     
     def __init__(self):
         self.settings = get_settings()
-        # In-memory storage (replace with Redis/Database in production)
-        self._usage_records: Dict[str, list] = defaultdict(list)  # user_id -> records
+        # In-memory columnar storage (replace with Redis/Database in production)
+        self._usage_records = ColumnarUsageStore()  # user_id -> columns
         self._rate_limits: Dict[str, Dict[str, Any]] = defaultdict(dict)  # user_id -> rate_limit_data
         
-        # Token costs (per 1K tokens) - approximate OpenAI pricing
-        self.token_costs = {
-            "gpt-4": 0.03,      # Input tokens
-            "gpt-4-output": 0.06,  # Output tokens
-            "gpt-3.5-turbo": 0.002,
-            "gpt-3.5-turbo-output": 0.002
+        # Token prices per model: (input, cached input, output) per token
+        self.model_prices: Dict[str, Tuple[float, float, float]] = {
+            model: (
+                prices["input"] / 1000,
+                prices.get("cached_input", prices["input"]) / 1000,
+                prices["output"] / 1000
+            )
+            for model, prices in self.settings.model_prices.items()
         }
+        self.default_model = self.settings.openai_model
+        
+        # Persistent write-behind ledger; replayed into memory on startup
+        self.ledger: Optional[UsageLedger] = None
+        if self.settings.usage_ledger_path:
+            self.ledger = UsageLedger(
+                self.settings.usage_ledger_path,
+                batch_size=self.settings.usage_ledger_batch_size,
+                flush_interval=self.settings.usage_ledger_flush_interval
+            )
+            self._load_ledger(self.settings.usage_retention_days)
+    
+    def _load_ledger(self, days: int):
+        """Rebuild in-memory columns from the ledger"""
+        loaded = 0
+        for (timestamp, user_id, business_id, endpoint, model, tokens,
+             prompt_tokens, completion_tokens, cached_tokens, cost) in self.ledger.replay(time.time() - days * 86400):
+            self._usage_records.append(
+                user_id or business_id or "anonymous",
+                timestamp,
+                tokens,
+                prompt_tokens,
+                completion_tokens,
+                cached_tokens,
+                cost,
+                endpoint,
+                model or self.default_model
+            )
+            loaded += 1
+        if loaded:
+            logger.info(f"Loaded {loaded} usage records from {self.ledger.path}")
+    
+    def calculate_cost(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0
+    ) -> float:
+        """Estimated cost in USD, pricing input, cached and output tokens separately"""
+        prices = self.model_prices.get(model) or self.model_prices.get(self.default_model)
+        if prices is None:
+            return 0.0
+        input_price, cached_price, output_price = prices
+        return (
+            (prompt_tokens - cached_tokens) * input_price
+            + cached_tokens * cached_price
+            + completion_tokens * output_price
+        )
     
     def record_usage(
         self,
@@ -56,13 +143,42 @@ class UsageTracker:
         endpoint: str,
         tokens_used: int,
         model: str = "gpt-4",
-        metadata: Dict[str, Any] = None
+        metadata: Dict[str, Any] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0
     ) -> UsageRecord:
-        """Record API usage"""
+        """Record API usage
+        
+        When the prompt/completion split is unknown all tokens are priced as
+        input. Only the columnar fields are retained; metadata is returned on
+        the record for the caller but not stored.
+        """
+        
+        if prompt_tokens is None:
+            prompt_tokens = tokens_used - completion_tokens
         
         # Calculate cost estimate
-        cost_per_1k = self.token_costs.get(model, self.token_costs["gpt-4"])
-        cost_estimate = (tokens_used / 1000) * cost_per_1k
+        cost_estimate = self.calculate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        
+        # Store record
+        key = user_id or business_id or "anonymous"
+        timestamp = self._usage_records.append(
+            key,
+            time.time(),
+            tokens_used,
+            prompt_tokens,
+            completion_tokens,
+            cached_tokens,
+            cost_estimate,
+            endpoint,
+            model
+        )
+        if self.ledger is not None:
+            self.ledger.append((
+                timestamp, user_id, business_id, endpoint, model, tokens_used,
+                prompt_tokens, completion_tokens, cached_tokens, cost_estimate
+            ))
         
         record = UsageRecord(
             user_id=user_id,
@@ -70,14 +186,14 @@ class UsageTracker:
             endpoint=endpoint,
             tokens_used=tokens_used,
             cost_estimate=cost_estimate,
-            timestamp=datetime.utcnow(),
-            metadata=metadata or {}
+            timestamp=datetime.utcfromtimestamp(timestamp),
+            metadata=metadata or {},
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            model=model
         )
         
-        # Store record
-        key = user_id or business_id or "anonymous"
-        self._usage_records[key].append(record)
-        
         logger.debug(f"Recorded usage: {tokens_used} tokens, ${cost_estimate:.4f} for {key}")
         return record
     
@@ -90,106 +206,142 @@ class UsageTracker:
         """Get usage statistics"""
         
         key = user_id or business_id or "anonymous"
-        records = self._usage_records.get(key, [])
         
         # Filter by date
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        recent_records = [r for r in records if r.timestamp > cutoff]
+        cutoff = time.time() - days * 86400
+        totals = self._usage_records.aggregate(key, cutoff)
         
-        if not recent_records:
+        if totals is None:
             return {
                 "total_requests": 0,
                 "total_tokens": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0,
                 "total_cost": 0.0,
                 "daily_average": 0,
                 "period_days": days
             }
         
-        total_requests = len(recent_records)
-        total_tokens = sum(r.tokens_used for r in recent_records)
-        total_cost = sum(r.cost_estimate for r in recent_records)
+        total_requests = totals["requests"]
         daily_average = total_requests / days if days > 0 else 0
         
-        # Endpoint breakdown
-        endpoint_stats = defaultdict(lambda: {"requests": 0, "tokens": 0, "cost": 0.0})
-        for record in recent_records:
-            endpoint_stats[record.endpoint]["requests"] += 1
-            endpoint_stats[record.endpoint]["tokens"] += record.tokens_used
-            endpoint_stats[record.endpoint]["cost"] += record.cost_estimate
-        
         return {
             "total_requests": total_requests,
-            "total_tokens": total_tokens,
-            "total_cost": round(total_cost, 4),
+            "total_tokens": totals["tokens"],
+            "prompt_tokens": totals["prompt_tokens"],
+            "completion_tokens": totals["completion_tokens"],
+            "cached_tokens": totals["cached_tokens"],
+            "total_cost": round(totals["cost"], 4),
             "daily_average": round(daily_average, 2),
             "period_days": days,
-            "endpoint_breakdown": dict(endpoint_stats),
-            "first_request": min(r.timestamp for r in recent_records).isoformat(),
-            "last_request": max(r.timestamp for r in recent_records).isoformat()
+            "endpoint_breakdown": totals["endpoint_breakdown"],
+            "first_request": datetime.utcfromtimestamp(totals["first_timestamp"]).isoformat(),
+            "last_request": datetime.utcfromtimestamp(totals["last_timestamp"]).isoformat()
         }
     
     def cleanup_old_records(self, days: int = 90):
         """Clean up old usage records"""
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        
-        total_removed = 0
-        for key in self._usage_records:
-            original_count = len(self._usage_records[key])
-            self._usage_records[key] = [
-                r for r in self._usage_records[key] 
-                if r.timestamp > cutoff
-            ]
-            removed = original_count - len(self._usage_records[key])
-            total_removed += removed
-        
+        cutoff = time.time() - days * 86400
+        total_removed = self._usage_records.truncate_before(cutoff)
         logger.info(f"Cleaned up {total_removed} old usage records")
 
 class RateLimiter:
-    """Rate limiting for API endpoints"""
+    """Rate limiting for API endpoints
+    
+    Implements GCRA (generic cell rate algorithm): each key stores a single
+    theoretical arrival time (TAT). A request is admitted when it would not
+    push the TAT more than one window ahead of now, which enforces a smooth
+    rate with bursts of at most ``requests_per_window``. Keys whose TAT is in
+    the past are fully replenished and are evicted by a periodic sweep.
+    """
     
     def __init__(self):
         self.settings = get_settings()
         # In-memory storage (replace with Redis in production)
-        self._request_counts: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        self._tats: Dict[str, float] = {}  # user_id:endpoint -> monotonic TAT
+        self._endpoint_limits: Dict[str, int] = dict(self.settings.rate_limit_endpoint_limits)
+        self._default_limit = self.settings.rate_limit_requests
+        self._next_sweep = time.monotonic() + self.settings.rate_limit_window
     
-    async def check_rate_limit(
+    def _limit_for(self, endpoint: str) -> int:
+        """Requests per window for an endpoint"""
+        return self._endpoint_limits.get(endpoint, self._default_limit)
+    
+    def acquire(
         self,
-        user_id: Optional[str] = None,
-        business_id: Optional[str] = None,
+        key: str,
+        endpoint: str = "default",
+        now: Optional[float] = None
+    ) -> bool:
+        """Consume one request for key if allowed; synchronous hot path"""
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        
+        window = self.settings.rate_limit_window
+        tat = self._tats.get(key, now)
+        if tat < now:
+            tat = now
+        new_tat = tat + window / self._limit_for(endpoint)
+        if new_tat - now > window:
+            return False
+        self._tats[key] = new_tat
+        return True
+    
+    def _sweep(self, now: float):
+        """Evict keys that have fully replenished"""
+        idle = [key for key, tat in self._tats.items() if tat <= now]
+        for key in idle:
+            del self._tats[key]
+        self._next_sweep = now + self.settings.rate_limit_window
+        if idle:
+            logger.debug(f"Evicted {len(idle)} idle rate limit keys")
+    
+    def status(
+        self,
+        key: str,
         endpoint: str = "default",
         requests_per_window: Optional[int] = None,
-        window_seconds: Optional[int] = None
+        window_seconds: Optional[int] = None,
+        now: Optional[float] = None
     ) -> RateLimitInfo:
-        """Check if request is within rate limits"""
+        """Current rate limit state for key without consuming a request"""
         
         # Use default limits if not specified
-        requests_per_window = requests_per_window or self.settings.rate_limit_requests
+        requests_per_window = requests_per_window or self._limit_for(endpoint)
         window_seconds = window_seconds or self.settings.rate_limit_window
+        if now is None:
+            now = time.monotonic()
         
-        key = f"{user_id or business_id or 'anonymous'}:{endpoint}"
-        now = datetime.utcnow()
-        
-        # Get current window data
-        window_data = self._request_counts[key]
-        window_start = window_data.get('window_start')
-        request_count = window_data.get('count', 0)
-        
-        # Reset window if expired
-        if not window_start or now - window_start > timedelta(seconds=window_seconds):
-            window_start = now
-            request_count = 0
+        # Time until the bucket is fully replenished
+        backlog = max(0.0, self._tats.get(key, now) - now)
+        interval = window_seconds / requests_per_window
         
         # Calculate remaining requests
-        requests_remaining = max(0, requests_per_window - request_count)
-        reset_time = window_start + timedelta(seconds=window_seconds)
+        requests_remaining = max(0, int((window_seconds - backlog) / interval + 1e-9))
+        reset_time = datetime.utcnow() + timedelta(seconds=backlog)
         
         return RateLimitInfo(
             requests_remaining=requests_remaining,
             reset_time=reset_time,
-            total_requests=request_count,
+            total_requests=requests_per_window - requests_remaining,
             window_seconds=window_seconds
         )
     
+    async def check_rate_limit(
+        self,
+        user_id: Optional[str] = None,
+        business_id: Optional[str] = None,
+        endpoint: str = "default",
+        requests_per_window: Optional[int] = None,
+        window_seconds: Optional[int] = None
+    ) -> RateLimitInfo:
+        """Check if request is within rate limits"""
+        key = f"{user_id or business_id or 'anonymous'}:{endpoint}"
+        return self.status(key, endpoint, requests_per_window, window_seconds)
+    
     async def record_request(
         self,
         user_id: Optional[str] = None,
@@ -198,37 +350,330 @@ class RateLimiter:
     ) -> bool:
         """Record a request and return True if within limits"""
         
-        rate_limit_info = await self.check_rate_limit(user_id, business_id, endpoint)
-        
-        if rate_limit_info.requests_remaining <= 0:
+        key = f"{user_id or business_id or 'anonymous'}:{endpoint}"
+        if not self.acquire(key, endpoint):
             logger.warning(f"Rate limit exceeded for {user_id or business_id}:{endpoint}")
             return False
         
-        # Record the request
-        key = f"{user_id or business_id or 'anonymous'}:{endpoint}"
-        now = datetime.utcnow()
-        
-        if key not in self._request_counts:
-            self._request_counts[key] = {'window_start': now, 'count': 0}
-        
-        window_data = self._request_counts[key]
-        
-        # Reset window if needed
-        if now - window_data['window_start'] > timedelta(seconds=self.settings.rate_limit_window):
-            window_data['window_start'] = now
-            window_data['count'] = 0
-        
-        window_data['count'] += 1
+        logger.debug(f"Recorded request for {key}")
+        return True
+
+class TokenQuota:
+    """Tokens-per-minute quotas for users and businesses
+    
+    Uses the same GCRA scheme as ``RateLimiter`` with a weight per request:
+    estimated tokens are reserved at admission and reconciled against the
+    actual usage once the request settles.
+    """
+    
+    WINDOW_SECONDS = 60.0
+    
+    def __init__(self):
+        self.settings = get_settings()
+        self._tats: Dict[str, float] = {}  # quota key -> monotonic TAT
+        self._user_tpm = self.settings.token_quota_user_tpm
+        self._business_tpm = self.settings.token_quota_business_tpm
+        self._next_sweep = time.monotonic() + self.WINDOW_SECONDS
+    
+    def keys_for(self, user_id: Optional[str], business_id: Optional[str]) -> Tuple[str, ...]:
+        """Quota keys that apply to a request"""
+        keys = []
+        if self.settings.token_quota_user_tpm > 0 and (user_id or not business_id):
+            keys.append(f"user:{user_id or 'anonymous'}")
+        if self.settings.token_quota_business_tpm > 0 and business_id:
+            keys.append(f"business:{business_id}")
+        return tuple(keys)
+    
+    def _tpm_for(self, key: str) -> int:
+        if key.startswith("business:"):
+            return self._business_tpm
+        return self._user_tpm
+    
+    def charged(self, keys: Tuple[str, ...], tokens: int) -> Tuple[int, ...]:
+        """Tokens ``reserve`` charges each key for a request of ``tokens``
         
-        logger.debug(f"Recorded request for {key}: {window_data['count']}/{self.settings.rate_limit_requests}")
+        A single request larger than a key's quota is admitted into an empty
+        bucket and charged the quota.
+        """
+        return tuple(min(max(tokens, 0), self._tpm_for(key)) for key in keys)
+    
+    def reserve(self, keys: Tuple[str, ...], tokens: int, now: Optional[float] = None) -> bool:
+        """Reserve tokens against every key, all or nothing"""
+        if not keys or tokens <= 0:
+            return True
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        
+        updates = []
+        for key, charge in zip(keys, self.charged(keys, tokens)):
+            tpm = self._tpm_for(key)
+            tat = max(self._tats.get(key, now), now)
+            new_tat = tat + charge * self.WINDOW_SECONDS / tpm
+            if new_tat - now > self.WINDOW_SECONDS:
+                return False
+            updates.append((key, new_tat))
+        
+        for key, new_tat in updates:
+            self._tats[key] = new_tat
         return True
+    
+    def adjust(self, keys: Tuple[str, ...], tokens: int):
+        """Charge (positive) or refund (negative) tokens without admission checks"""
+        if not tokens:
+            return
+        for key in keys:
+            if key in self._tats:
+                self._tats[key] += tokens * self.WINDOW_SECONDS / self._tpm_for(key)
+            elif tokens > 0:
+                self._tats[key] = time.monotonic() + tokens * self.WINDOW_SECONDS / self._tpm_for(key)
+    
+    def reconcile(self, keys: Tuple[str, ...], charged: Tuple[int, ...], tokens: int):
+        """Replace what ``reserve`` charged each key with the actual ``tokens``"""
+        for key, charge in zip(keys, charged):
+            self.adjust((key,), tokens - charge)
+    
+    def _sweep(self, now: float):
+        """Evict keys that have fully replenished"""
+        for key in [key for key, tat in self._tats.items() if tat <= now]:
+            del self._tats[key]
+        self._next_sweep = now + self.WINDOW_SECONDS
+
+class SpendCaps:
+    """Monthly USD spend caps per business and per user
+    
+    Running totals for the current month are kept per key, so each admission
+    check is a pair of dictionary lookups. Totals reset at the month boundary
+    in ``settings.timezone``.
+    
+    With several worker processes each one only sees its own spend, so the
+    totals are periodically replaced by sums read from the shared ledger.
+    """
+    
+    SOFT = "soft"
+    HARD = "hard"
+    
+    def __init__(self, ledger: Optional[UsageLedger] = None):
+        self.settings = get_settings()
+        self._timezone = ZoneInfo(self.settings.timezone)
+        self._totals: Dict[str, float] = {}  # business:<id> / user:<id> -> USD this month
+        self._month_start, self._month_end = self._month_bounds(time.time())
+        self._ledger = ledger
+        self._sync_interval = self.settings.spend_cap_sync_seconds if self.settings.workers > 1 else 0
+        self._next_sync = time.monotonic() + self._sync_interval
+        self._syncing = False
+        if ledger is not None:
+            for business_id, user_id, cost in ledger.replay_costs(self._month_start):
+                self.add(business_id, user_id, cost)
+    
+    def _maybe_sync(self):
+        """Refresh totals from the ledger shared by all workers, off the event loop"""
+        if self._syncing or time.monotonic() < self._next_sync:
+            return
+        self._syncing = True
+        self._next_sync = time.monotonic() + self._sync_interval
+        
+        def sync(month_start: float):
+            try:
+                totals = self._ledger.spend_totals(month_start)
+                if month_start == self._month_start:
+                    self._totals = totals
+            except Exception as e:
+                logger.warning(f"Spend cap sync failed: {str(e)}")
+            finally:
+                self._syncing = False
+        
+        threading.Thread(target=sync, args=(self._month_start,), name="spend-cap-sync", daemon=True).start()
+    
+    def _month_bounds(self, now: float) -> Tuple[float, float]:
+        """Epoch seconds of the start of the current and next local month"""
+        local = datetime.fromtimestamp(now, self._timezone)
+        start = local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if start.month == 12:
+            end = start.replace(year=start.year + 1, month=1)
+        else:
+            end = start.replace(month=start.month + 1)
+        return start.timestamp(), end.timestamp()
+    
+    def _roll_month(self):
+        now = time.time()
+        if now >= self._month_end:
+            self._totals.clear()
+            self._month_start, self._month_end = self._month_bounds(now)
+            logger.info("Reset monthly spend totals")
+    
+    def _caps_for(self, business_id: Optional[str], user_id: Optional[str]):
+        if business_id:
+            cap = self.settings.business_monthly_budgets.get(
+                business_id, self.settings.default_business_monthly_budget
+            )
+            if cap > 0:
+                yield f"business:{business_id}", cap
+        if user_id and self.settings.user_monthly_budget > 0:
+            yield f"user:{user_id}", self.settings.user_monthly_budget
+    
+    def check(self, business_id: Optional[str], user_id: Optional[str]) -> Optional[str]:
+        """Return HARD when a cap is exhausted, SOFT when one is nearly spent, else None"""
+        self._roll_month()
+        if self._sync_interval and self._ledger is not None:
+            self._maybe_sync()
+        level = None
+        for key, cap in self._caps_for(business_id, user_id):
+            spent = self._totals.get(key, 0.0)
+            if spent >= cap:
+                return self.HARD
+            if spent >= cap * self.settings.budget_soft_threshold:
+                level = self.SOFT
+        return level
+    
+    def add(self, business_id: Optional[str], user_id: Optional[str], cost: float):
+        """Add settled spend to the running monthly totals"""
+        self._roll_month()
+        if business_id:
+            key = f"business:{business_id}"
+            self._totals[key] = self._totals.get(key, 0.0) + cost
+        if user_id:
+            key = f"user:{user_id}"
+            self._totals[key] = self._totals.get(key, 0.0) + cost
+    
+    def get_status(self, business_id: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Spend and caps for the current month"""
+        self._roll_month()
+        return {
+            "month_start": datetime.fromtimestamp(self._month_start, self._timezone).isoformat(),
+            "caps": [
+                {"key": key, "cap": cap, "spent": round(self._totals.get(key, 0.0), 4)}
+                for key, cap in self._caps_for(business_id, user_id)
+            ],
+            "level": self.check(business_id, user_id)
+        }
 
 class UsageService:
     """Combined usage tracking and rate limiting service"""
     
     def __init__(self):
+        self.settings = get_settings()
         self.usage_tracker = UsageTracker()
         self.rate_limiter = RateLimiter()
+        self.token_quota = TokenQuota()
+        self.spend_caps = SpendCaps(self.usage_tracker.ledger)
+    
+    async def admit(
+        self,
+        user_id: Optional[str] = None,
+        business_id: Optional[str] = None,
+        endpoint: str = "chat",
+        estimated_tokens: int = 0
+    ) -> Reservation:
+        """Admit a request, consuming exactly one rate limit slot
+        
+        ``estimated_tokens`` (prompt plus ``max_tokens``) are reserved against
+        the user and business token quotas so that over-quota work is rejected
+        before any OpenAI call. Businesses past their soft monthly budget are
+        admitted with ``reservation.model`` set to the cheaper downgrade model;
+        past the hard budget they are rejected. The returned reservation must
+        be passed to ``settle`` once the request has completed, whether or not
+        it succeeded; settling never touches the rate limiter. A request
+        whose deadline has already passed is rejected with 504 without
+        consuming anything.
+        """
+        with span("rate_limit_check"):
+            key = f"{user_id or business_id or 'anonymous'}:{endpoint}"
+            now = time.monotonic()
+            quota_keys = self.token_quota.keys_for(user_id, business_id)
+            reserved = self.token_quota.charged(quota_keys, estimated_tokens)
+            budget_level = self.spend_caps.check(business_id, user_id)
+            model = None
+            error = None
+            status_code = 429
+
+            deadline = current_deadline()
+
+            if deadline is not None and deadline.expired():
+                # Nothing admitted now could be answered in time
+                allowed = False
+                error = "Deadline exceeded"
+                status_code = 504
+            elif budget_level == SpendCaps.HARD:
+                allowed = False
+                error = "Monthly budget exceeded"
+                status_code = 402
+                logger.warning(f"Monthly budget exceeded for {business_id or user_id}")
+            elif not self.token_quota.reserve(quota_keys, estimated_tokens, now):
+                allowed = False
+                error = "Token quota exceeded"
+                logger.warning(f"Token quota exceeded for {user_id or business_id}:{endpoint}")
+            elif not self.rate_limiter.acquire(key, endpoint, now):
+                allowed = False
+                error = "Rate limit exceeded"
+                self.token_quota.reconcile(quota_keys, reserved, 0)
+                logger.warning(f"Rate limit exceeded for {user_id or business_id}:{endpoint}")
+            else:
+                allowed = True
+                if budget_level == SpendCaps.SOFT:
+                    model = self.settings.budget_downgrade_model
+
+            return Reservation(
+                allowed=allowed,
+                user_id=user_id,
+                business_id=business_id,
+                endpoint=endpoint,
+                rate_limit=self.rate_limiter.status(key, endpoint, now=now),
+                admitted_at=now,
+                estimated_tokens=estimated_tokens if allowed else 0,
+                quota_keys=quota_keys,
+                reserved_tokens=reserved if allowed else (),
+                model=model,
+                error=error,
+                status_code=status_code
+            )
+    
+    def settle(
+        self,
+        reservation: Reservation,
+        tokens_used: int = 0,
+        model: str = "gpt-4",
+        metadata: Dict[str, Any] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        cancelled: bool = False
+    ) -> Optional[UsageRecord]:
+        """Record the outcome of an admitted request
+        
+        Reconciles the token quota reservation with the actual usage. Work
+        cancelled because the client disconnected is recorded under
+        ``<endpoint>_cancelled`` so it shows up separately in the endpoint
+        breakdown.
+        """
+        with span("usage_settle"):
+            if not reservation.allowed:
+                raise ValueError("Cannot settle a rejected reservation")
+            if reservation.settled:
+                logger.warning(f"Reservation for {reservation.endpoint} settled twice")
+                return None
+            reservation.settled = True
+            self.token_quota.reconcile(
+                reservation.quota_keys, reservation.reserved_tokens, tokens_used
+            )
+
+            # Record usage if tokens were used
+            if tokens_used <= 0:
+                return None
+            record = self.usage_tracker.record_usage(
+                reservation.user_id,
+                reservation.business_id,
+                f"{reservation.endpoint}_cancelled" if cancelled else reservation.endpoint,
+                tokens_used,
+                model,
+                metadata,
+                prompt_tokens,
+                completion_tokens,
+                cached_tokens
+            )
+            self.spend_caps.add(reservation.business_id, reservation.user_id, record.cost_estimate)
+            return record
     
     async def process_request(
         self,
@@ -239,52 +684,24 @@ class UsageService:
         model: str = "gpt-4",
         metadata: Dict[str, Any] = None
     ) -> Dict[str, Any]:
-        """Process request with rate limiting and usage tracking"""
+        """Process request with rate limiting and usage tracking
         
-        # Check rate limits
-        rate_limit_info = await self.rate_limiter.check_rate_limit(
-            user_id, business_id, endpoint
-        )
+        Single-call form of ``admit`` followed by ``settle``.
+        """
+        reservation = await self.admit(user_id, business_id, endpoint)
         
-        if rate_limit_info.requests_remaining <= 0:
+        if not reservation.allowed:
             return {
                 "allowed": False,
-                "error": "Rate limit exceeded",
-                "rate_limit": {
-                    "requests_remaining": rate_limit_info.requests_remaining,
-                    "reset_time": rate_limit_info.reset_time.isoformat(),
-                    "total_requests": rate_limit_info.total_requests
-                }
+                "error": reservation.error,
+                "rate_limit": reservation.rate_limit_dict()
             }
         
-        # Record request
-        allowed = await self.rate_limiter.record_request(user_id, business_id, endpoint)
-        
-        if not allowed:
-            return {
-                "allowed": False,
-                "error": "Rate limit exceeded",
-                "rate_limit": {
-                    "requests_remaining": 0,
-                    "reset_time": rate_limit_info.reset_time.isoformat(),
-                    "total_requests": rate_limit_info.total_requests
-                }
-            }
-        
-        # Record usage if tokens were used
-        usage_record = None
-        if tokens_used > 0:
-            usage_record = self.usage_tracker.record_usage(
-                user_id, business_id, endpoint, tokens_used, model, metadata
-            )
+        usage_record = self.settle(reservation, tokens_used, model, metadata)
         
         return {
             "allowed": True,
-            "rate_limit": {
-                "requests_remaining": rate_limit_info.requests_remaining - 1,
-                "reset_time": rate_limit_info.reset_time.isoformat(),
-                "total_requests": rate_limit_info.total_requests + 1
-            },
+            "rate_limit": reservation.rate_limit_dict(),
             "usage_record": asdict(usage_record) if usage_record else None
         }
     
@@ -297,6 +714,34 @@ class UsageService:
         """Get usage statistics"""
         return self.usage_tracker.get_usage_stats(user_id, business_id, days)
     
+    def get_budget_status(
+        self,
+        business_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get monthly spend against caps"""
+        return self.spend_caps.get_status(business_id, user_id)
+    
+    def get_store_sizes(self) -> Dict[str, int]:
+        """Sizes of the in-memory usage and limiter state"""
+        return {
+            "usage_records": len(self.usage_tracker._usage_records),
+            "usage_keys": self.usage_tracker._usage_records.key_count(),
+            "rate_limit_keys": len(self.rate_limiter._tats),
+            "token_quota_keys": len(self.token_quota._tats),
+            "spend_cap_keys": len(self.spend_caps._totals)
+        }
+    
+    def get_ledger_stats(self) -> Optional[Dict[str, Any]]:
+        """Write-behind ledger statistics, or None when persistence is disabled"""
+        ledger = self.usage_tracker.ledger
+        return ledger.get_stats() if ledger is not None else None
+    
+    def close(self):
+        """Flush pending usage records to the ledger"""
+        if self.usage_tracker.ledger is not None:
+            self.usage_tracker.ledger.close()
+    
     async def get_rate_limit_status(
         self,
         user_id: Optional[str] = None,
@@ -308,10 +753,13 @@ class UsageService:
 
 # Singleton instance
 _usage_service = None
+_usage_service_lock = threading.Lock()
 
 def get_usage_service() -> UsageService:
     """Get usage service instance"""
     global _usage_service
     if _usage_service is None:
-        _usage_service = UsageService()
+        with _usage_service_lock:
+            if _usage_service is None:
+                _usage_service = UsageService()
     return _usage_service
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+Columnar in-memory storage for usage records
+"""
+
+import logging
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Any
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; aggregations fall back to pure Python
+    np = None
+
+logger = logging.getLogger(__name__)
+
+class UsageColumns:
+    """Append-only typed columns holding the usage records of a single key.
+
+    Timestamps are UTC epoch seconds and are kept non-decreasing so that
+    time-window lookups are a binary search and retention is a slice.
+    """
+
+    __slots__ = (
+        "timestamps", "tokens", "prompt_tokens", "completion_tokens",
+        "cached_tokens", "costs", "endpoints", "models"
+    )
+
+    def __init__(self):
+        self.timestamps = array("d")
+        self.tokens = array("q")
+        self.prompt_tokens = array("q")
+        self.completion_tokens = array("q")
+        self.cached_tokens = array("q")  # subset of prompt_tokens served from cache
+        self.costs = array("d")
+        self.endpoints = array("I")  # interned endpoint codes
+        self.models = array("I")  # interned model codes
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def columns(self) -> tuple:
+        """All columns, in slot order"""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def append(
+        self,
+        timestamp: float,
+        tokens: int,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        cost: float,
+        endpoint: int,
+        model: int
+    ) -> float:
+        """Append a row and return the timestamp actually stored"""
+        # Clamp against wall-clock steps backwards to keep the column sorted
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        self.timestamps.append(timestamp)
+        self.tokens.append(tokens)
+        self.prompt_tokens.append(prompt_tokens)
+        self.completion_tokens.append(completion_tokens)
+        self.cached_tokens.append(cached_tokens)
+        self.costs.append(cost)
+        self.endpoints.append(endpoint)
+        self.models.append(model)
+        return timestamp
+
+    def start_index(self, cutoff: float) -> int:
+        """Index of the first row strictly newer than cutoff"""
+        return bisect_right(self.timestamps, cutoff)
+
+    def truncate_before(self, cutoff: float) -> int:
+        """Drop every row at or before cutoff, returning the number removed"""
+        index = self.start_index(cutoff)
+        if index:
+            for column in self.columns():
+                del column[:index]
+        return index
+
+# Additive columns rolled up by aggregate(), with their output names
+SUMMED_COLUMNS = (
+    ("tokens", "tokens"),
+    ("prompt_tokens", "prompt_tokens"),
+    ("completion_tokens", "completion_tokens"),
+    ("cached_tokens", "cached_tokens"),
+    ("costs", "cost"),
+)
+
+class ColumnarUsageStore:
+    """Per-key columnar usage store with interned endpoint and model names"""
+
+    def __init__(self):
+        self._columns: Dict[str, UsageColumns] = {}
+        self._endpoint_codes: Dict[str, int] = {}
+        self._endpoint_names: List[str] = []
+        self._model_codes: Dict[str, int] = {}
+        self._model_names: List[str] = []
+        self._rows = 0
+
+    @staticmethod
+    def _intern(name: str, codes: Dict[str, int], names: List[str]) -> int:
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def append(
+        self,
+        key: str,
+        timestamp: float,
+        tokens: int,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        cost: float,
+        endpoint: str,
+        model: str
+    ) -> float:
+        """Append a usage row for key and return the stored timestamp"""
+        columns = self._columns.get(key)
+        if columns is None:
+            columns = self._columns[key] = UsageColumns()
+        self._rows += 1
+        return columns.append(
+            timestamp,
+            tokens,
+            prompt_tokens,
+            completion_tokens,
+            cached_tokens,
+            cost,
+            self._intern(endpoint, self._endpoint_codes, self._endpoint_names),
+            self._intern(model, self._model_codes, self._model_names)
+        )
+
+    def aggregate(self, key: str, since: float) -> Optional[Dict[str, Any]]:
+        """Aggregate rows for key newer than since, or None if there are none"""
+        columns = self._columns.get(key)
+        if columns is None:
+            return None
+
+        start = columns.start_index(since)
+        count = len(columns) - start
+        if count <= 0:
+            return None
+
+        if np is not None:
+            totals = self._aggregate_numpy(columns, start)
+        else:
+            totals = self._aggregate_python(columns, start)
+
+        totals["requests"] = count
+        totals["first_timestamp"] = columns.timestamps[start]
+        totals["last_timestamp"] = columns.timestamps[-1]
+        return totals
+
+    def _aggregate_numpy(self, columns: UsageColumns, start: int) -> Dict[str, Any]:
+        endpoints = np.frombuffer(columns.endpoints, dtype=np.uint32)[start:]
+        size = len(self._endpoint_names)
+        requests = np.bincount(endpoints, minlength=size)
+        active = np.flatnonzero(requests)
+
+        totals: Dict[str, Any] = {}
+        breakdown = {
+            self._endpoint_names[code]: {"requests": int(requests[code])} for code in active
+        }
+        for attr, name in SUMMED_COLUMNS:
+            column = getattr(columns, attr)
+            values = np.frombuffer(column, dtype=np.float64 if column.typecode == "d" else np.int64)[start:]
+            cast = float if column.typecode == "d" else int
+            totals[name] = cast(values.sum())
+            per_endpoint = np.bincount(endpoints, weights=values, minlength=size)
+            for code in active:
+                breakdown[self._endpoint_names[code]][name] = cast(per_endpoint[code])
+
+        totals["endpoint_breakdown"] = breakdown
+        return totals
+
+    def _aggregate_python(self, columns: UsageColumns, start: int) -> Dict[str, Any]:
+        endpoints = columns.endpoints[start:]
+        totals: Dict[str, Any] = {}
+        breakdown: Dict[int, Dict[str, Any]] = {}
+        for code in endpoints:
+            stats = breakdown.get(code)
+            if stats is None:
+                stats = breakdown[code] = {"requests": 0}
+            stats["requests"] += 1
+
+        for attr, name in SUMMED_COLUMNS:
+            values = getattr(columns, attr)[start:]
+            zero = 0.0 if values.typecode == "d" else 0
+            totals[name] = sum(values, zero)
+            for stats in breakdown.values():
+                stats[name] = zero
+            for code, value in zip(endpoints, values):
+                breakdown[code][name] += value
+
+        totals["endpoint_breakdown"] = {
+            self._endpoint_names[code]: stats for code, stats in breakdown.items()
+        }
+        return totals
+
+    def truncate_before(self, cutoff: float) -> int:
+        """Drop rows at or before cutoff across all keys, returning the number removed"""
+        removed = 0
+        for key in list(self._columns):
+            columns = self._columns[key]
+            removed += columns.truncate_before(cutoff)
+            if not columns:
+                del self._columns[key]
+        self._rows -= removed
+        return removed
+
+    def key_count(self) -> int:
+        return len(self._columns)
+
+    def __len__(self) -> int:
+        return self._rows
@@ -0,0 +1,134 @@
+"""
+Startup warm-up: build services, pre-render prompts and open the OpenAI connection
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional, Any
+
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+LANGUAGES = ("auto", "es", "en")
+
+class Warmup:
+    """Runs the warm-up steps once and records how long each took"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: Dict[str, float] = {}  # step -> milliseconds
+        self.openai_connected: Optional[bool] = None
+        self.error: Optional[str] = None
+        self._services: Optional[asyncio.Future] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self, tones: Iterable[str], industries: Iterable[str]):
+        """Warm up in steps, yielding to the event loop between them"""
+        self.started_at = time.perf_counter()
+        try:
+            # Importing the OpenAI SDK takes a few hundred milliseconds, so
+            # the synchronous steps run off the event loop
+            started = time.perf_counter()
+            await self.build_services()
+            self.steps["services"] = (time.perf_counter() - started) * 1000
+            await self._step("prompts", lambda: self._render_prompts(tones, industries))
+            if self.settings.warmup_openai_connection:
+                await self._open_connection()
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Warm-up failed: {str(e)}", exc_info=True)
+        finally:
+            self.finished_at = time.perf_counter()
+        logger.info(
+            f"Warm-up finished in {(self.finished_at - self.started_at) * 1000:.0f}ms: "
+            + ", ".join(f"{name}={ms:.0f}ms" for name, ms in self.steps.items())
+        )
+
+    async def build_services(self):
+        """Build the service singletons off the event loop, once per process
+
+        The warm-up and the health prober both wait on the same build, so
+        the OpenAI SDK is imported once and never on the event loop.
+        """
+        if self._services is None:
+            self._services = asyncio.ensure_future(asyncio.to_thread(self._build_services))
+        await asyncio.shield(self._services)
+
+    async def _step(self, name: str, build):
+        started = time.perf_counter()
+        await asyncio.to_thread(build)
+        self.steps[name] = (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    def _build_services():
+        from app.services.conversation_service import get_conversation_service
+        from app.services.openai_service import get_openai_service
+        from app.services.quantile_service import get_quantile_service
+        from app.services.usage_service import get_usage_service
+
+        get_openai_service()
+        get_conversation_service()
+        get_usage_service()
+        get_quantile_service()
+
+    @staticmethod
+    def _render_prompts(tones: Iterable[str], industries: Iterable[str]):
+        from app.services.openai_service import get_openai_service
+
+        openai_service = get_openai_service()
+        for tone in tones:
+            for industry in industries:
+                for language in LANGUAGES:
+                    openai_service._get_system_prompt(tone, industry, language)
+
+    async def _open_connection(self):
+        """Put live connections to each OpenAI endpoint into the client's pool
+
+        ``openai_warm_connections`` requests per endpoint run concurrently, so
+        each one opens its own connection and the first burst skips the
+        handshakes.
+        """
+        from app.services.openai_service import get_openai_service
+
+        started = time.perf_counter()
+        upstreams = get_openai_service().pool.upstreams
+        connections = max(1, self.settings.openai_warm_connections)
+        results = await asyncio.gather(*(
+            upstream.client.with_options(timeout=self.settings.warmup_timeout, max_retries=0).models.list()
+            for upstream in upstreams
+            for _ in range(connections)
+        ), return_exceptions=True)
+        self.openai_connected = False
+        for index, upstream in enumerate(upstreams):
+            error = next((r for r in results[index * connections:(index + 1) * connections] if isinstance(r, Exception)), None)
+            if error is None:
+                self.openai_connected = True
+            else:
+                logger.warning(f"Warm-up connection to OpenAI upstream {upstream.name} failed: {str(error)}")
+        self.steps["openai_connection"] = (time.perf_counter() - started) * 1000
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "done": self.done,
+            "duration_ms": round((self.finished_at - self.started_at) * 1000, 1) if self.done else None,
+            "steps_ms": {name: round(ms, 1) for name, ms in self.steps.items()},
+            "openai_connected": self.openai_connected,
+            "error": self.error
+        }
+
+# Singleton instance
+_warmup = None
+
+def get_warmup() -> Warmup:
+    """Get startup warm-up instance"""
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup()
+    return _warmup
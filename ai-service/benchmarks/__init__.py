@@ -0,0 +1,11 @@
+"""
+Offline microbenchmarks for the CaboAi AI Service
+
+Run from the ai-service directory, e.g. ``python -m benchmarks.bench_rate_limiter``.
+"""
+
+import os
+
+# Settings require these; benchmarks never talk to real services
+for _name in ("OPENAI_API_KEY", "API_KEY", "SECRET_KEY", "CORS_ORIGIN"):
+    os.environ.setdefault(_name, "benchmark")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+OpenAI client connection pool benchmark
+
+Sends bursts of concurrent chat completions, separated by idle gaps, to a
+local OpenAI-compatible endpoint that takes a fixed time per request and
+counts the TCP connections it accepts. The first request on each new
+connection is delayed by ``HANDSHAKE_SECONDS`` to stand in for the TCP and
+TLS round trips to the real API. For each client configuration it reports
+how many requests reused a pooled connection, the client CPU time per
+request and the latency on top of the endpoint's own. Bursts larger than
+the keep-alive pool close connections after every burst and the next burst
+pays for new ones; a much larger pool than the concurrency needs costs CPU,
+since httpcore scans every pooled connection for each queued request.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import socket
+import statistics
+import time
+
+from config.settings import get_settings
+from app.services.openai_service import build_http_client
+
+BURSTS = 20
+BURST_SIZE = 32
+IDLE_SECONDS = 0.2
+UPSTREAM_SECONDS = 0.02
+HANDSHAKE_SECONDS = 0.03
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Hola"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+}).encode()
+
+class Stub:
+    """Keep-alive HTTP/1.1 completions endpoint counting connections and requests
+
+    It runs in its own process so that serving does not compete with the
+    client for the GIL.
+    """
+
+    def __init__(self):
+        self.connections = multiprocessing.Value("i", 0)
+        self.requests = multiprocessing.Value("i", 0)
+        self.process = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        with self.connections.get_lock():
+            self.connections.value += 1
+        delay = UPSTREAM_SECONDS + HANDSHAKE_SECONDS
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                await reader.readexactly(length)
+                with self.requests.get_lock():
+                    self.requests.value += 1
+                await asyncio.sleep(delay)
+                delay = UPSTREAM_SECONDS
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                    b"content-length: " + str(len(COMPLETION)).encode() + b"\r\n\r\n" + COMPLETION
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _serve(self, sock: socket.socket):
+        async def serve():
+            server = await asyncio.start_server(self.handle, sock=sock)
+            await server.serve_forever()
+        asyncio.run(serve())
+
+    def start(self) -> int:
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(1024)
+        self.process = multiprocessing.Process(target=self._serve, args=(sock,), daemon=True)
+        self.process.start()
+        return sock.getsockname()[1]
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+async def run(port: int, http_client) -> list:
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key="bench", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0, http_client=http_client)
+    messages = [{"role": "user", "content": "Hola"}]
+
+    async def one() -> float:
+        started = time.perf_counter()
+        await client.chat.completions.create(model="gpt-4", messages=messages)
+        return time.perf_counter() - started
+
+    latencies = []
+    for _ in range(BURSTS):
+        latencies += await asyncio.gather(*(one() for _ in range(BURST_SIZE)))
+        await asyncio.sleep(IDLE_SECONDS)
+    await client.close()
+    return latencies
+
+def main():
+    settings = get_settings()
+    configs = {
+        "SDK defaults": None,
+        "keep-alive 8": build_http_client(settings.model_copy(update={"openai_max_keepalive_connections": 8})),
+        "settings": build_http_client(settings),
+        "pool 512": build_http_client(settings.model_copy(update={
+            "openai_max_connections": 512, "openai_max_keepalive_connections": 512
+        }))
+    }
+
+    print(
+        f"🔌 {BURSTS} bursts of {BURST_SIZE} concurrent requests, {UPSTREAM_SECONDS * 1000:.0f}ms upstream, "
+        f"{HANDSHAKE_SECONDS * 1000:.0f}ms per new connection"
+    )
+    print(f"  {'client':<14} {'connections':>11} {'reuse':>7} {'CPU/request':>12} {'p50 overhead':>13} {'p99 overhead':>13}")
+    for name, http_client in configs.items():
+        stub = Stub()
+        port = stub.start()
+        cpu_started = time.process_time()
+        latencies = asyncio.run(run(port, http_client))
+        cpu_ms = (time.process_time() - cpu_started) * 1000 / len(latencies)
+        stub.stop()
+        connections, requests = stub.connections.value, stub.requests.value
+        overhead = sorted((latency - UPSTREAM_SECONDS) * 1000 for latency in latencies)
+        print(
+            f"  {name:<14} {connections:>11} {1 - connections / requests:>7.1%} {cpu_ms:>10.2f}ms "
+            f"{statistics.median(overhead):>11.2f}ms {overhead[int(len(overhead) * 0.99)]:>11.2f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
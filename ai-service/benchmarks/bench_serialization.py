@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for /chat response serialization
+
+Compares FastAPI's default path (validate the returned model against
+``response_model``, ``jsonable_encoder``, stdlib ``json``) with the path the
+handler now takes (serialize the model it built with pydantic's encoder and
+return the bytes directly), and the stdlib and orjson encoders for plain
+dict responses.
+"""
+
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from main import ChatResponse, _model_response
+
+REPLY = (
+    "¡Gracias por su mensaje! Con gusto le ayudamos con su reservación en Cabo San Lucas. "
+    "Tenemos disponibilidad para las fechas solicitadas y le enviaremos la confirmación en breve."
+) * 3
+
+def build_response() -> ChatResponse:
+    return ChatResponse(
+        response=REPLY,
+        tone="professional",
+        industry="hospitality",
+        language="es",
+        conversation_id="3a5b7443-7961-4df4-b114-704533d89d96",
+        tokens_used=412,
+        success=True,
+        error=None
+    )
+
+async def fastapi_default(field) -> bytes:
+    content = await serialize_response(field=field, response_content=build_response(), is_coroutine=True)
+    return JSONResponse(content).body
+
+def direct_model() -> bytes:
+    return _model_response(build_response()).body
+
+def run_sync(coroutine):
+    # serialize_response never suspends here, so skip event loop overhead
+    try:
+        coroutine.send(None)
+    except StopIteration as result:
+        return result.value
+    raise RuntimeError("coroutine suspended")
+
+def bench(label: str, run, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        run()
+    per_call = (time.perf_counter() - start) / iterations
+    print(f"{label:<36} {per_call * 1e6:7.2f} µs/response")
+    return per_call
+
+def main():
+    iterations = 50_000
+    field = APIRoute("/chat", build_response, response_model=ChatResponse).response_field
+    assert run_sync(fastapi_default(field)) == direct_model()
+
+    print("⏱️  /chat response serialization")
+    before = bench("response_model re-validation + json", lambda: run_sync(fastapi_default(field)), iterations)
+    after = bench("model_dump_json, returned directly", direct_model, iterations)
+    print(f"{'speedup':<36} {before / after:7.2f}x")
+
+    print("⏱️  dict responses (/health, /stats)")
+    payload = jsonable_encoder(build_response().model_dump())
+    stdlib = bench("JSONResponse (stdlib json)", lambda: JSONResponse(payload), iterations)
+    fast = bench("ORJSONResponse", lambda: ORJSONResponse(payload), iterations)
+    print(f"{'speedup':<36} {stdlib / fast:7.2f}x")
+
+if __name__ == "__main__":
+    main()
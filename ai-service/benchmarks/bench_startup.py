@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark: import time and time-to-first-request
+
+Starts the service in a subprocess against a minimal local OpenAI-compatible
+endpoint, with and without the startup warm-up, and reports when it starts
+listening, when it is warm, and the latency of the first and subsequent
+/chat requests.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+RUNS = 5
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Hola"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+}).encode()
+MODELS = b'{"object": "list", "data": []}'
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            body = MODELS if head.startswith(b"GET") else COMPLETION
+            writer.write(
+                b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                b"content-length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def start_stub() -> int:
+    """Serve canned completions on an ephemeral port from a background thread"""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(_handle, "127.0.0.1", 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server.sockets[0].getsockname()[1]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def child_env(**extra) -> dict:
+    env = dict(os.environ, PYTHONPATH=SERVICE_DIR, USAGE_LEDGER_PATH="", TRACE_FILE="")
+    env.update(extra)
+    return env
+
+def import_seconds(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    samples = [
+        float(subprocess.check_output([sys.executable, "-c", code], cwd=SERVICE_DIR, env=child_env()))
+        for _ in range(RUNS)
+    ]
+    return statistics.median(samples)
+
+def cold_start(stub_port: int, warmup: bool) -> dict:
+    port = free_port()
+    env = child_env(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        STARTUP_WARMUP=str(warmup).lower(),
+        LOOP_MONITOR_ENABLED="false"
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(base_url=base, timeout=30.0) as client:
+            while True:
+                try:
+                    health = client.get("/health").json()
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            listening = time.perf_counter() - started
+            while warmup and not health["warmup"]["done"]:
+                time.sleep(0.005)
+                health = client.get("/health").json()
+            ready = time.perf_counter() - started
+
+            latencies = []
+            for i in range(21):
+                request_started = time.perf_counter()
+                response = client.post("/chat", json={"message": "Hola, ¿tienen disponibilidad?", "user_id": f"bench{i}"})
+                latencies.append(time.perf_counter() - request_started)
+                # A failed or fallback reply would time the error path instead
+                response.raise_for_status()
+                if not response.json()["success"]:
+                    raise RuntimeError(f"/chat fell back: {response.json()['error']}")
+            ready_status = client.get("/readyz").status_code
+            if ready_status != 200:
+                raise RuntimeError(f"/readyz returned {ready_status} after the warm-up")
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "listening": listening,
+        "ready": ready,
+        "first_chat": latencies[0],
+        "steady_chat": statistics.median(latencies[1:])
+    }
+
+def main():
+    print("⏱️  Import time (median of 5 fresh interpreters)")
+    for module in ("main", "openai"):
+        print(f"  import {module:<10} {import_seconds(module) * 1000:8.1f} ms")
+
+    stub_port = start_stub()
+    print("⏱️  Cold start (median of 5)")
+    print(f"  {'warm-up':<8} {'listening':>10} {'ready':>10} {'1st /chat':>10} {'steady':>10}")
+    for warmup in (False, True):
+        runs = [cold_start(stub_port, warmup) for _ in range(RUNS)]
+        row = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+        print(
+            f"  {'on' if warmup else 'off':<8} {row['listening']:8.1f}ms {row['ready']:8.1f}ms "
+            f"{row['first_chat']:8.1f}ms {row['steady_chat']:8.1f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub server for offline load tests
+
+Implements ``POST /v1/chat/completions`` (plain and streamed) and
+``GET /v1/models`` with configurable latency, completion length, error and
+429 rates, so the service can be load-tested without an API key:
+
+    python -m benchmarks.openai_stub --port 8100 --latency lognormal:400:0.5 --rate-limit-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 python main.py
+
+Latencies and token counts take a distribution spec: ``fixed:V``,
+``uniform:LOW:HIGH``, ``normal:MEAN:STDDEV``, ``lognormal:MEDIAN:SIGMA`` or
+``exponential:MEAN``. Each request draws from its own generator seeded with
+``--seed`` and the request's sequence number, so a run with the same seed
+and request order behaves identically. ``GET /stub/stats`` returns counts
+of what was served; ``POST /stub/reset`` clears them.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+WORDS = (
+    "Gracias por su mensaje. Con gusto le ayudamos con su reserva en Cabo San Lucas; "
+    "tenemos disponibilidad para las fechas solicitadas y le enviaremos los detalles."
+).split()
+
+class Distribution:
+    """Random value drawn from a ``kind:arg[:arg]`` spec"""
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+
+    def __init__(self, spec: str):
+        kind, _, args = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown distribution {kind!r}, expected one of {tuple(self.KINDS)}")
+        try:
+            self.args = [float(arg) for arg in args.split(":")] if args else []
+        except ValueError:
+            raise ValueError(f"Invalid distribution spec {spec!r}")
+        if len(self.args) != self.KINDS[kind]:
+            raise ValueError(f"{kind} takes {self.KINDS[kind]} argument(s), got {spec!r}")
+        self.kind = kind
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.args[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.args)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.args)
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        else:
+            value = rng.expovariate(1 / self.args[0])
+        return max(0.0, value)
+
+    def __repr__(self) -> str:
+        return self.spec
+
+def _error(status_code: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"message": message, "type": error_type, "param": None, "code": None}},
+        status_code=status_code,
+        headers=headers
+    )
+
+def _prompt_tokens(messages: List[dict]) -> int:
+    # Roughly four characters per token plus per-message overhead
+    return sum(4 + len(str(message.get("content") or "")) // 4 for message in messages) + 3
+
+def _sse(payload: dict) -> bytes:
+    return b"data: " + json.dumps(payload, separators=(",", ":")).encode() + b"\n\n"
+
+def create_app(options: argparse.Namespace) -> FastAPI:
+    """Stub application configured by the parsed command line ``options``"""
+    app = FastAPI(title="OpenAI stub", docs_url=None, redoc_url=None, openapi_url=None)
+    stats = {"requests": 0, "streamed": 0, "completed": 0, "errors": 0, "rate_limited": 0, "aborted": 0,
+             "completion_tokens": 0}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": options.model, "object": "model", "created": 0, "owned_by": "stub"}]}
+
+    @app.get("/stub/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/stub/reset")
+    async def reset():
+        for key in stats:
+            stats[key] = 0
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        started = time.monotonic()
+        sequence = stats["requests"]
+        stats["requests"] += 1
+        rng = random.Random(f"{options.seed}:{sequence}")
+
+        try:
+            body = await request.json()
+            messages = body["messages"]
+        except (ValueError, KeyError, TypeError):
+            stats["errors"] += 1
+            return _error(400, "Request body must be JSON with 'messages'", "invalid_request_error")
+
+        # Rate limits are answered at once, like the real API
+        if rng.random() < options.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return _error(
+                429, "Rate limit reached for requests (stub)", "requests",
+                headers={
+                    "retry-after": str(options.retry_after),
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": f"{options.retry_after}s"
+                }
+            )
+
+        first_token = options.latency.sample(rng) / 1000
+        if rng.random() < options.error_rate:
+            await asyncio.sleep(first_token)
+            stats["errors"] += 1
+            return _error(options.error_status, "The server had an error processing your request (stub)", "server_error")
+
+        wanted = max(1, round(options.completion_tokens.sample(rng)))
+        limit = body.get("max_tokens") or body.get("max_completion_tokens")
+        completion_tokens = min(wanted, limit) if limit else wanted
+        finish_reason = "length" if completion_tokens < wanted else "stop"
+        prompt_tokens = _prompt_tokens(messages)
+        token_seconds = options.token_latency / 1000
+        words = [WORDS[i % len(WORDS)] for i in range(completion_tokens)]
+        model = body.get("model") or options.model
+        completion_id = f"chatcmpl-stub{sequence}"
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token + token_seconds * completion_tokens - (time.monotonic() - started))
+            stats["completed"] += 1
+            stats["completion_tokens"] += completion_tokens
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": finish_reason
+                }],
+                "usage": usage
+            }
+
+        stats["streamed"] += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        abort_at = rng.randrange(completion_tokens) if rng.random() < options.stream_abort_rate else None
+
+        async def events():
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+            await asyncio.sleep(first_token - (time.monotonic() - started))
+            yield _sse({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+            # Tokens are paced against the stream's start so sleep overshoot does not add up
+            emitted_at = time.monotonic()
+            for index, word in enumerate(words):
+                if index == abort_at:
+                    stats["aborted"] += 1
+                    raise ConnectionAbortedError("Stub aborted the stream")
+                await asyncio.sleep(emitted_at + token_seconds * (index + 1) - time.monotonic())
+                content = word if index == 0 else " " + word
+                yield _sse({**chunk, "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]})
+            yield _sse({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+            if include_usage:
+                yield _sse({**chunk, "choices": [], "usage": usage})
+            yield b"data: [DONE]\n\n"
+            stats["completed"] += 1
+            stats["completion_tokens"] += completion_tokens
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=Distribution, default=Distribution("lognormal:300:0.4"),
+                        help="time to first token in ms (default lognormal:300:0.4)")
+    parser.add_argument("--token-latency", type=float, default=10.0,
+                        help="ms per completion token after the first (default 10)")
+    parser.add_argument("--completion-tokens", type=Distribution, default=Distribution("uniform:60:200"),
+                        help="completion length in tokens, capped by max_tokens (default uniform:60:200)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry-after seconds sent with 429s")
+    parser.add_argument("--stream-abort-rate", type=float, default=0.0,
+                        help="fraction of streams cut off part way through")
+    parser.add_argument("--model", default="gpt-4", help="model listed by /v1/models")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def main():
+    import uvicorn
+
+    options = parse_args()
+    print(
+        f"🧪 OpenAI stub on http://{options.host}:{options.port}/v1 — latency {options.latency!r}, "
+        f"{options.token_latency:g}ms/token, completion tokens {options.completion_tokens!r}, "
+        f"errors {options.error_rate:.1%}, 429s {options.rate_limit_rate:.1%}, seed {options.seed}"
+    )
+    uvicorn.run(create_app(options), host=options.host, port=options.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
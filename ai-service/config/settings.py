@@ -4,7 +4,7 @@ Configuration settings for CaboAI Service
 
 import os
 from functools import lru_cache
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -21,7 +21,48 @@ class Settings(BaseSettings):
     # Server
     host: str = Field(default="0.0.0.0", env="HOST")
     port: int = Field(default=8000, env="PORT")
+    # Rate limiter, token quota, idempotency and conversation state is per
+    # worker: each worker enforces the full configured limits, and a client
+    # whose connections land on several workers gets up to WORKERS times as
+    # much. WORKERS > 1 is refused while any of it is in use unless
+    # ALLOW_PER_WORKER_STATE acknowledges that
     workers: int = Field(default=1, env="WORKERS")
+    allow_per_worker_state: bool = Field(default=False, env="ALLOW_PER_WORKER_STATE")
+    # How often each worker publishes its metrics for /metrics on the others
+    metrics_snapshot_seconds: float = Field(default=5.0, env="METRICS_SNAPSHOT_SECONDS")
+    server_backlog: int = Field(default=2048, env="SERVER_BACKLOG")
+    server_limit_concurrency: int = Field(default=0, env="SERVER_LIMIT_CONCURRENCY")
+    server_keepalive_timeout: int = Field(default=5, env="SERVER_KEEPALIVE_TIMEOUT")
+    server_graceful_timeout: int = Field(default=30, env="SERVER_GRACEFUL_TIMEOUT")
+    server_access_log: bool = Field(default=False, env="SERVER_ACCESS_LOG")
+    startup_warmup: bool = Field(default=True, env="STARTUP_WARMUP")
+    warmup_openai_connection: bool = Field(default=True, env="WARMUP_OPENAI_CONNECTION")
+    warmup_timeout: float = Field(default=5.0, env="WARMUP_TIMEOUT")
+    chat_concurrency_initial: int = Field(default=64, env="CHAT_CONCURRENCY_INITIAL")
+    chat_concurrency_min: int = Field(default=4, env="CHAT_CONCURRENCY_MIN")
+    chat_concurrency_max: int = Field(default=512, env="CHAT_CONCURRENCY_MAX")
+    openai_concurrency_initial: int = Field(default=32, env="OPENAI_CONCURRENCY_INITIAL")
+    openai_concurrency_min: int = Field(default=2, env="OPENAI_CONCURRENCY_MIN")
+    openai_concurrency_max: int = Field(default=256, env="OPENAI_CONCURRENCY_MAX")
+    concurrency_latency_tolerance: float = Field(default=2.0, env="CONCURRENCY_LATENCY_TOLERANCE")
+    concurrency_backoff: float = Field(default=0.9, env="CONCURRENCY_BACKOFF")
+    shed_with_fallback: bool = Field(default=False, env="SHED_WITH_FALLBACK")
+    shed_retry_after_seconds: int = Field(default=1, env="SHED_RETRY_AFTER_SECONDS")
+    idempotency_ttl_seconds: int = Field(default=3600, env="IDEMPOTENCY_TTL_SECONDS")
+    idempotency_max_entries: int = Field(default=10000, env="IDEMPOTENCY_MAX_ENTRIES")
+    cancel_on_disconnect: bool = Field(default=True, env="CANCEL_ON_DISCONNECT")
+    # Long enough for OPENAI_MAX_TOKENS at DEADLINE_TOKENS_PER_SECOND, so only
+    # callers asking for less time get shorter replies
+    chat_deadline_ms: int = Field(default=60000, env="CHAT_DEADLINE_MS")
+    deadline_margin_ms: int = Field(default=250, env="DEADLINE_MARGIN_MS")
+    deadline_tokens_per_second: float = Field(default=40.0, env="DEADLINE_TOKENS_PER_SECOND")
+    deadline_min_tokens: int = Field(default=32, env="DEADLINE_MIN_TOKENS")
+    background_drain_timeout: float = Field(default=10.0, env="BACKGROUND_DRAIN_TIMEOUT")
+    health_probe_interval: float = Field(default=15.0, env="HEALTH_PROBE_INTERVAL")
+    health_probe_timeout: float = Field(default=3.0, env="HEALTH_PROBE_TIMEOUT")
+    # Whether /readyz needs an OpenAI endpoint to answer GET /models; turn off
+    # for gateways that do not implement it (the check is still reported)
+    readiness_requires_openai: bool = Field(default=True, env="READINESS_REQUIRES_OPENAI")
     
     # Security
     api_key: str = Field(env="AI_SERVICE_API_KEY")
@@ -47,6 +88,34 @@ class Settings(BaseSettings):
     openai_model: str = Field(default="gpt-4", env="OPENAI_MODEL")
     openai_max_tokens: int = Field(default=2000, env="OPENAI_MAX_TOKENS")
     openai_temperature: float = Field(default=0.7, env="OPENAI_TEMPERATURE")
+    openai_stream_usage: bool = Field(default=True, env="OPENAI_STREAM_USAGE")
+    openai_max_retries: int = Field(default=2, env="OPENAI_MAX_RETRIES")
+    openai_timeout: float = Field(default=60.0, env="OPENAI_TIMEOUT")
+    openai_connect_timeout: float = Field(default=5.0, env="OPENAI_CONNECT_TIMEOUT")
+    openai_pool_timeout: float = Field(default=5.0, env="OPENAI_POOL_TIMEOUT")
+    openai_max_connections: int = Field(default=128, env="OPENAI_MAX_CONNECTIONS")
+    openai_max_keepalive_connections: int = Field(default=32, env="OPENAI_MAX_KEEPALIVE_CONNECTIONS")
+    openai_keepalive_expiry: float = Field(default=30.0, env="OPENAI_KEEPALIVE_EXPIRY")
+    openai_http2: bool = Field(default=False, env="OPENAI_HTTP2")
+    openai_warm_connections: int = Field(default=4, env="OPENAI_WARM_CONNECTIONS")
+    # OpenAI-compatible endpoints to balance across, as a JSON list of
+    # {"name", "base_url", "api_key", "model", "weight"}; empty uses the
+    # default endpoint with OPENAI_API_KEY. An endpoint's model replaces
+    # OPENAI_MODEL there, but a budget downgrade model still wins
+    openai_endpoints: List[Dict[str, Any]] = Field(default=[], env="OPENAI_ENDPOINTS")
+    openai_balancer: str = Field(default="least_outstanding", env="OPENAI_BALANCER")
+    openai_failover_attempts: int = Field(default=2, env="OPENAI_FAILOVER_ATTEMPTS")
+    openai_eject_failures: int = Field(default=3, env="OPENAI_EJECT_FAILURES")
+    openai_eject_seconds: float = Field(default=30.0, env="OPENAI_EJECT_SECONDS")
+    
+    # Model prices in USD per 1K tokens; cached_input defaults to input
+    model_prices: Dict[str, Dict[str, float]] = Field(
+        default={
+            "gpt-4": {"input": 0.03, "output": 0.06},
+            "gpt-3.5-turbo": {"input": 0.002, "output": 0.002}
+        },
+        env="MODEL_PRICES"
+    )
     
     # Los Cabos specific
     timezone: str = Field(default="America/Mazatlan", env="TIMEZONE")
@@ -66,8 +135,48 @@ class Settings(BaseSettings):
     # Rate limiting
     rate_limit_requests: int = Field(default=100, env="RATE_LIMIT_REQUESTS")
     rate_limit_window: int = Field(default=60, env="RATE_LIMIT_WINDOW")
+    rate_limit_endpoint_limits: Dict[str, int] = Field(
+        default_factory=dict,
+        env="RATE_LIMIT_ENDPOINT_LIMITS"
+    )
+    
+    # Token quotas (tokens per minute, 0 disables)
+    token_quota_user_tpm: int = Field(default=40000, env="TOKEN_QUOTA_USER_TPM")
+    token_quota_business_tpm: int = Field(default=150000, env="TOKEN_QUOTA_BUSINESS_TPM")
+    
+    # Monthly spend caps in USD (0 disables); reset on the TIMEZONE month boundary
+    business_monthly_budgets: Dict[str, float] = Field(default_factory=dict, env="BUSINESS_MONTHLY_BUDGETS")
+    default_business_monthly_budget: float = Field(default=0.0, env="DEFAULT_BUSINESS_MONTHLY_BUDGET")
+    user_monthly_budget: float = Field(default=0.0, env="USER_MONTHLY_BUDGET")
+    budget_soft_threshold: float = Field(default=0.8, env="BUDGET_SOFT_THRESHOLD")
+    budget_downgrade_model: str = Field(default="gpt-3.5-turbo", env="BUDGET_DOWNGRADE_MODEL")
+    
+    # Usage ledger (write-behind persistence; empty path disables)
+    usage_ledger_path: Optional[str] = Field(default="data/usage_ledger.db", env="USAGE_LEDGER_PATH")
+    usage_ledger_batch_size: int = Field(default=500, env="USAGE_LEDGER_BATCH_SIZE")
+    usage_ledger_flush_interval: float = Field(default=0.5, env="USAGE_LEDGER_FLUSH_INTERVAL")
+    usage_retention_days: int = Field(default=90, env="USAGE_RETENTION_DAYS")
+    spend_cap_sync_seconds: float = Field(default=5.0, env="SPEND_CAP_SYNC_SECONDS")
     
     # Monitoring
+    quantile_window_seconds: int = Field(default=3600, env="QUANTILE_WINDOW_SECONDS")
+    quantile_interval_seconds: int = Field(default=60, env="QUANTILE_INTERVAL_SECONDS")
+    quantile_relative_accuracy: float = Field(default=0.01, env="QUANTILE_RELATIVE_ACCURACY")
+    quantile_max_series: int = Field(default=1000, env="QUANTILE_MAX_SERIES")
+    server_timing_enabled: bool = Field(default=True, env="SERVER_TIMING_ENABLED")
+    trace_sample_rate: float = Field(default=0.0, env="TRACE_SAMPLE_RATE")
+    trace_file: Optional[str] = Field(default="data/traces.jsonl", env="TRACE_FILE")
+    loop_monitor_enabled: bool = Field(default=True, env="LOOP_MONITOR_ENABLED")
+    loop_lag_interval_ms: float = Field(default=100.0, env="LOOP_LAG_INTERVAL_MS")
+    loop_block_threshold_ms: float = Field(default=250.0, env="LOOP_BLOCK_THRESHOLD_MS")
+    profiling_enabled: bool = Field(default=False, env="PROFILING_ENABLED")
+    profiling_sample_rate: float = Field(default=0.01, env="PROFILING_SAMPLE_RATE")
+    profiling_header: str = Field(default="X-Debug-Profile", env="PROFILING_HEADER")
+    # Value PROFILING_HEADER must carry to force profiling; unset ignores the header
+    profiling_token: Optional[str] = Field(default=None, env="PROFILING_TOKEN")
+    profiling_interval_ms: float = Field(default=5.0, env="PROFILING_INTERVAL_MS")
+    profiling_flush_seconds: float = Field(default=60.0, env="PROFILING_FLUSH_SECONDS")
+    profiling_dir: str = Field(default="data/profiles", env="PROFILING_DIR")
     sentry_dsn: Optional[str] = Field(default=None, env="SENTRY_DSN")
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
     
@@ -79,6 +188,7 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         case_sensitive = False
+        protected_namespaces = ("settings_",)
 
 
 @lru_cache()
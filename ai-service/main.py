@@ -1,20 +1,80 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, Response
+from starlette.background import BackgroundTask
 import os
+import asyncio
+import json
+import time
 import logging
-from typing import Optional, Dict, Any
-from pydantic import BaseModel, Field
+from contextlib import aclosing
+from typing import Awaitable, Optional, Dict, Any, Tuple
+from pydantic import BaseModel, Field, ValidationError
 from enum import Enum
 
 from config.settings import get_settings
-from app.services.openai_service import get_openai_service
+from app.services.openai_service import get_openai_service, close_http_client
 from app.services.conversation_service import get_conversation_service
 from app.services.usage_service import get_usage_service
+from app.services.quantile_service import get_quantile_service
+from app.services.metrics_service import get_metrics_service, MetricsMiddleware
+from app.services.tracing_service import span, get_trace_writer, TracingMiddleware
+from app.services.loop_monitor import get_loop_monitor
+from app.services.warmup import get_warmup
+from app.services.health_service import get_health_prober
+from app.services.concurrency_service import get_concurrency_service
+from app.services.task_pipeline import get_task_pipeline
+from app.services.idempotency_service import get_idempotency_service
+from app.services.deadline import start_deadline
+from app.services.profiling_service import get_profiler, ProfilingMiddleware
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="CaboAi AI Service")
+try:
+    import orjson  # noqa: F401
+    DefaultJSONResponse = ORJSONResponse
+except ImportError:  # fall back to the stdlib encoder
+    DefaultJSONResponse = JSONResponse
+
+try:
+    from websockets.exceptions import ConnectionClosed
+    # Sending on a connection the client has closed raises the server
+    # library's own error rather than WebSocketDisconnect
+    CLIENT_GONE = (WebSocketDisconnect, ConnectionClosed)
+except ImportError:  # uvicorn without the websockets library
+    CLIENT_GONE = (WebSocketDisconnect,)
+
+app = FastAPI(title="CaboAi AI Service", default_response_class=DefaultJSONResponse)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+if get_settings().profiling_enabled:
+    app.add_middleware(ProfilingMiddleware)
+
+def _register_gauges():
+    """Store sizes and queue depths, read only when /metrics is scraped"""
+    metrics = get_metrics_service()
+    
+    def store_sizes():
+        sizes = dict(get_conversation_service().get_store_sizes())
+        sizes.update(get_usage_service().get_store_sizes())
+        sizes["quantile_series"] = get_quantile_service().series_count()
+        sizes.update(get_idempotency_service().get_store_sizes())
+        return {(store,): size for store, size in sizes.items()}
+    
+    def ledger_stat(name):
+        def read():
+            stats = get_usage_service().get_ledger_stats()
+            return stats[name] if stats else None
+        return read
+    
+    metrics.gauge("caboai_store_size", "Entries held by in-memory stores", store_sizes, ("store",))
+    metrics.gauge("caboai_usage_ledger_queue_depth", "Usage records waiting to be written", ledger_stat("queue_depth"))
+    metrics.gauge("caboai_usage_ledger_last_flush_ms", "Duration of the last ledger batch commit", ledger_stat("last_flush_ms"))
+    metrics.gauge("caboai_usage_ledger_spilled_records", "Usage records spilled to the fallback file after failed commits", ledger_stat("records_spilled"))
+    metrics.gauge("caboai_usage_ledger_dropped_records", "Usage records lost because neither the ledger nor the spill file could be written", ledger_stat("records_dropped"))
+
+_register_gauges()
 
 class ToneType(str, Enum):
     PROFESSIONAL = "professional"
@@ -33,6 +93,7 @@ class ChatMessage(BaseModel):
     industry: IndustryType = IndustryType.HOSPITALITY
     language: str = Field(default="auto", description="Language preference: auto, es, en")
     user_id: Optional[str] = Field(None, description="User identifier for conversation tracking")
+    business_id: Optional[str] = Field(None, description="Business identifier for quotas and usage tracking")
     business_context: Optional[Dict[str, Any]] = Field(None, description="Business context information")
 
 class ChatResponse(BaseModel):
@@ -45,25 +106,97 @@ class ChatResponse(BaseModel):
     success: bool
     error: Optional[str] = None
 
+def _model_response(model: BaseModel) -> Response:
+    """Serialize a model built by the handler itself
+    
+    Returning a Response skips FastAPI's re-validation against
+    ``response_model``; pydantic's own JSON serializer encodes it in one pass.
+    """
+    return Response(model.model_dump_json(), media_type="application/json")
+
+@app.on_event("startup")
+async def startup():
+    """Start the event loop lag monitor, warm up services and publish worker metrics in the background"""
+    settings = get_settings()
+    if settings.loop_monitor_enabled:
+        get_loop_monitor().start()
+    if settings.startup_warmup:
+        app.state.warmup_task = asyncio.create_task(get_warmup().run(list(ToneType), list(IndustryType)))
+    get_health_prober().start()
+    metrics = get_metrics_service()
+    if metrics.worker is not None:
+        # Any worker can answer a scrape for all of them
+        app.state.metrics_task = asyncio.create_task(metrics.publish(settings.metrics_snapshot_seconds))
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Drain background jobs, connections, usage records, traces, profiles and metrics before exiting"""
+    warmup_task = getattr(app.state, "warmup_task", None)
+    if warmup_task is not None:
+        warmup_task.cancel()
+    metrics_task = getattr(app.state, "metrics_task", None)
+    if metrics_task is not None:
+        metrics_task.cancel()
+    await get_health_prober().stop()
+    await get_task_pipeline().drain()
+    await close_http_client()
+    if get_settings().loop_monitor_enabled:
+        await get_loop_monitor().stop()
+    get_usage_service().close()
+    trace_writer = get_trace_writer()
+    if trace_writer is not None:
+        trace_writer.close()
+    if get_settings().profiling_enabled:
+        get_profiler().close()
+    if metrics_task is not None:
+        get_metrics_service().write_snapshot()
+
 @app.get("/")
 async def root():
     return {"message": "CaboAi AI Service is running!", "status": "healthy"}
 
+@app.get("/livez")
+async def livez():
+    """Liveness probe: the process is serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe from cached dependency checks; never calls a dependency"""
+    settings = get_settings()
+    prober = get_health_prober()
+    warmed = not settings.startup_warmup or get_warmup().done
+    ready = warmed and prober.is_ready()
+    return DefaultJSONResponse(
+        {"status": "ready" if ready else "not_ready", "warmed_up": warmed, "dependencies": prober.get_status()},
+        status_code=200 if ready else 503
+    )
+
 @app.get("/health")
 async def health():
-    """Enhanced health check with OpenAI connectivity"""
+    """Enhanced health check with cached OpenAI connectivity"""
     try:
         # Basic health check
         health_status = {"status": "healthy"}
         
-        # Check OpenAI service availability
-        openai_service = get_openai_service()
-        health_status["openai_available"] = True
+        # Dependency results come from the background prober
+        prober = get_health_prober()
+        health_status["openai_available"] = prober.statuses["openai"].healthy
+        health_status["dependencies"] = prober.get_status()
+        health_status["warmup"] = get_warmup().get_status()
         
-        # Get conversation service stats
-        conversation_service = get_conversation_service()
-        analytics = conversation_service.get_analytics()
-        health_status["conversations"] = analytics.get("total_conversations", 0)
+        # Conversation store size, without scanning it
+        health_status["conversations"] = get_conversation_service().get_store_sizes()["conversations"]
+        
+        # Usage ledger queue depth and flush latency
+        ledger_stats = get_usage_service().get_ledger_stats()
+        if ledger_stats is not None:
+            health_status["usage_ledger"] = ledger_stats
+        
+        if get_settings().loop_monitor_enabled:
+            health_status["event_loop"] = get_loop_monitor().get_stats()
+        
+        health_status["concurrency"] = get_concurrency_service().get_stats()
         
         return health_status
         
@@ -71,18 +204,178 @@ async def health():
         logger.error(f"Health check failed: {str(e)}")
         return {"status": "degraded", "error": str(e)}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(
+        get_metrics_service().render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.get("/stats/percentiles")
+async def percentiles(
+    metric: Optional[str] = None,
+    window_seconds: Optional[int] = None,
+    endpoint: Optional[str] = None,
+    model: Optional[str] = None,
+    business_id: Optional[str] = None
+):
+    """Latency and token percentiles over a sliding window"""
+    quantile_service = get_quantile_service()
+    metrics = [metric] if metric else quantile_service.get_metrics()
+    return {
+        name: quantile_service.get_percentiles(
+            name, window_seconds, endpoint=endpoint, model=model, business_id=business_id
+        )
+        for name in metrics
+    }
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(chat_message: ChatMessage):
+async def chat(
+    request: Request,
+    chat_message: ChatMessage,
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key reuse the first result"),
+    request_timeout_ms: Optional[int] = Header(
+        None, alias="X-Request-Timeout-Ms", description="How long the caller will wait for the response"
+    )
+):
     """Upgraded chat endpoint with real OpenAI integration"""
     
+    # The deadline reaches every service through the request context
+    start_deadline(request_timeout_ms, get_settings())
+    
+    if idempotency_key:
+        idempotency_service = get_idempotency_service()
+        work = idempotency_service.run(
+            f"{chat_message.user_id or ''}:{idempotency_key}",
+            idempotency_service.fingerprint(chat_message.model_dump_json()),
+            lambda: _limited_chat(chat_message)
+        )
+    else:
+        work = _unwrap_response(_limited_chat(chat_message))
+    
+    # A keyed request is finished and cached even if its client goes away:
+    # the retry that follows a client timeout replays it instead of paying
+    # for another generation
+    if idempotency_key or not get_settings().cancel_on_disconnect:
+        return await work
+    return await _cancel_on_disconnect(request, work, "chat")
+
+async def _unwrap_response(work: Awaitable[Tuple[Response, bool]]) -> Response:
+    response, _ = await work
+    return response
+
+async def _cancel_on_disconnect(request: Request, work: Awaitable[Response], endpoint: str) -> Response:
+    """Await work, cancelling it if the client disconnects first
+    
+    Cancellation propagates into the OpenAI call, whose connection is closed
+    so that upstream generation stops. The 499 returned afterwards is never
+    delivered; it only labels the request in metrics and traces.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        get_metrics_service().cancellations.inc(endpoint)
+        logger.info(f"Client disconnected, cancelled /{endpoint} request")
+        return Response(status_code=499)
+    return task.result()
+
+async def _wait_for_disconnect(request: Request):
+    """Return once the client has gone away
+    
+    The body has already been read, so the next ASGI message is the
+    disconnect.
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def _limited_chat(chat_message: ChatMessage) -> Tuple[Response, bool]:
+    """Run a chat request under the adaptive concurrency limit"""
+    
+    # Shed excess load up front instead of queueing behind a slow upstream
+    limiter = get_concurrency_service().chat
+    admitted = limiter.try_acquire()
+    if admitted is None:
+        return _shed_response(chat_message), False
+    
+    # Only requests that reached OpenAI and got an answer say anything about
+    # capacity; rejections and fallbacks return early
+    generated = False
+    try:
+        response, generated = await _chat(chat_message)
+        return response, generated
+    finally:
+        limiter.release(admitted, sample=generated)
+
+def _shed_response(chat_message: ChatMessage) -> Response:
+    """503 with Retry-After, or the canned fallback when so configured"""
+    settings = get_settings()
+    if settings.shed_with_fallback:
+        get_metrics_service().fallbacks.inc("shed")
+        return _model_response(ChatResponse(
+            response=_get_fallback_response(chat_message.tone, chat_message.language, chat_message.industry),
+            tone=chat_message.tone,
+            industry=chat_message.industry,
+            language=chat_message.language,
+            conversation_id="fallback",
+            tokens_used=0,
+            success=False,
+            error="Server overloaded"
+        ))
+    raise HTTPException(
+        status_code=503,
+        detail="Server overloaded. Please try again later.",
+        headers={"Retry-After": str(settings.shed_retry_after_seconds)}
+    )
+
+async def _chat(chat_message: ChatMessage) -> Tuple[Response, bool]:
+    """Handle an admitted chat request; also returns whether OpenAI generated the reply"""
+    started = time.perf_counter()
     openai_service = get_openai_service()
     conversation_service = get_conversation_service()
     usage_service = get_usage_service()
+    quantile_service = get_quantile_service()
+    metrics = get_metrics_service()
+    reservation = None
     
     try:
+        # Check rate limits and reserve estimated tokens; the reservation is
+        # settled once generation completes
+        reservation = await usage_service.admit(
+            user_id=chat_message.user_id,
+            business_id=chat_message.business_id,
+            endpoint="chat",
+            estimated_tokens=openai_service.estimate_request_tokens(
+                chat_message.message,
+                business_context=chat_message.business_context
+            )
+        )
+        
+        if not reservation.allowed:
+            raise HTTPException(
+                status_code=reservation.status_code,
+                detail=f"{reservation.error}. Please try again later."
+            )
+        
         # Create conversation for context tracking
         conversation_id = conversation_service.create_conversation(
             user_email=chat_message.user_id,
+            business_id=chat_message.business_id,
             metadata={
                 "industry": chat_message.industry,
                 "tone": chat_message.tone,
@@ -90,18 +383,6 @@ async def chat(chat_message: ChatMessage):
             }
         )
         
-        # Check rate limits
-        usage_result = await usage_service.process_request(
-            user_id=chat_message.user_id,
-            endpoint="chat"
-        )
-        
-        if not usage_result["allowed"]:
-            raise HTTPException(
-                status_code=429,
-                detail="Rate limit exceeded. Please try again later."
-            )
-        
         # Add user message to conversation
         conversation_service.add_message(
             conversation_id, "user", chat_message.message
@@ -113,42 +394,44 @@ async def chat(chat_message: ChatMessage):
             tone=chat_message.tone,
             industry=chat_message.industry,
             language=chat_message.language,
-            business_context=chat_message.business_context
+            business_context=chat_message.business_context,
+            model=reservation.model
         )
         
-        # Add AI response to conversation
-        if ai_response["success"]:
-            conversation_service.add_message(
-                conversation_id, "assistant", ai_response["response"],
-                metadata={
-                    "tokens_used": ai_response["tokens_used"],
-                    "model": ai_response["model"]
-                }
-            )
-            
-            # Record usage
-            await usage_service.process_request(
-                user_id=chat_message.user_id,
-                endpoint="chat",
-                tokens_used=ai_response["tokens_used"],
-                model=ai_response["model"]
-            )
+        e2e_latency_ms = (time.perf_counter() - started) * 1000
+        with span("serialization"):
+            response = _model_response(ChatResponse(
+                response=ai_response["response"],
+                tone=ai_response["tone"],
+                industry=chat_message.industry,
+                language=ai_response["language"],
+                conversation_id=conversation_id,
+                tokens_used=ai_response.get("tokens_used", 0),
+                success=ai_response["success"],
+                error=ai_response.get("error")
+            ))
         
-        return ChatResponse(
-            response=ai_response["response"],
-            tone=ai_response["tone"],
-            industry=chat_message.industry,
-            language=ai_response["language"],
-            conversation_id=conversation_id,
-            tokens_used=ai_response.get("tokens_used", 0),
-            success=ai_response["success"],
-            error=ai_response.get("error")
+        # Conversation, usage and percentile bookkeeping is queued once the
+        # response body has been sent, and runs in order per conversation
+        response.background = BackgroundTask(
+            _submit_background, conversation_id, _record_chat, chat_message, reservation, ai_response,
+            conversation_id, e2e_latency_ms
         )
+        return response, ai_response["success"]
         
     except HTTPException:
         raise
+    except asyncio.CancelledError:
+        # The client disconnected mid-generation
+        if reservation is not None and reservation.allowed and not reservation.settled:
+            _settle_cancelled(chat_message, reservation)
+        raise
     except Exception as e:
         logger.error(f"Chat error: {str(e)}", exc_info=True)
+        metrics.fallbacks.inc("chat_error")
+        
+        if reservation is not None and reservation.allowed and not reservation.settled:
+            usage_service.settle(reservation)
         
         # Provide fallback response
         fallback_response = _get_fallback_response(
@@ -157,7 +440,12 @@ async def chat(chat_message: ChatMessage):
             chat_message.industry
         )
         
-        return ChatResponse(
+        quantile_service.record(
+            "e2e_latency_ms", (time.perf_counter() - started) * 1000,
+            business_id=chat_message.business_id
+        )
+        
+        return _model_response(ChatResponse(
             response=fallback_response,
             tone=chat_message.tone,
             industry=chat_message.industry,
@@ -166,7 +454,254 @@ async def chat(chat_message: ChatMessage):
             tokens_used=0,
             success=False,
             error=str(e)
+        )), False
+
+@app.websocket("/chat/ws")
+async def chat_ws(
+    websocket: WebSocket,
+    user_id: Optional[str] = None,
+    business_id: Optional[str] = None,
+    tone: ToneType = ToneType.PROFESSIONAL,
+    industry: IndustryType = IndustryType.HOSPITALITY,
+    language: str = "auto"
+):
+    """Multi-turn chat over one connection, streaming replies as they are generated
+    
+    The connection is bound to one conversation, so every turn sees the
+    earlier ones. Each client frame is a JSON turn ``{"message": ...}`` that
+    may override tone, industry, language and business_context, and is
+    admitted against the same rate limits and token quotas as ``/chat``.
+    Turns run one at a time; closing the connection cancels the turn in
+    progress.
+    """
+    await websocket.accept()
+    defaults = {"tone": tone, "industry": industry, "language": language}
+    conversation_id = get_conversation_service().create_conversation(
+        user_email=user_id, business_id=business_id, metadata=dict(defaults)
+    )
+    await websocket.send_json({"type": "session", "conversation_id": conversation_id})
+    
+    turn: Optional[asyncio.Task] = None
+    receiver: Optional[asyncio.Task] = None
+    interrupted = False
+    try:
+        while True:
+            receiver = asyncio.ensure_future(websocket.receive_text())
+            if turn is not None:
+                # Watch for a disconnect while the reply streams; a message
+                # sent meanwhile waits for the turn to finish
+                await asyncio.wait((turn, receiver), return_when=asyncio.FIRST_COMPLETED)
+                if not turn.done() and isinstance(receiver.exception(), CLIENT_GONE):
+                    break
+                try:
+                    await turn
+                except CLIENT_GONE:
+                    # The client closed while the reply was being sent
+                    interrupted = True
+                    raise
+                turn = None
+            text = await receiver
+            receiver = None
+            
+            try:
+                payload = json.loads(text)
+                if not isinstance(payload, dict):
+                    raise ValueError("expected a JSON object")
+                chat_message = ChatMessage.model_validate(
+                    {**defaults, **payload, "user_id": user_id, "business_id": business_id}
+                )
+            except (ValueError, ValidationError) as e:
+                await websocket.send_json({"type": "error", "status": 422, "detail": str(e)})
+                continue
+            turn = asyncio.ensure_future(_ws_turn(websocket, conversation_id, chat_message))
+    except CLIENT_GONE:
+        pass
+    except Exception as e:
+        logger.warning(f"WebSocket session {conversation_id} ended: {e!r}")
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        if turn is not None and not turn.done():
+            turn.cancel()
+            try:
+                await turn
+            except (asyncio.CancelledError, Exception):
+                pass
+            interrupted = True
+        if interrupted:
+            get_metrics_service().cancellations.inc("chat_ws")
+            logger.info(f"Client disconnected, cancelled turn in conversation {conversation_id}")
+
+async def _ws_turn(websocket: WebSocket, conversation_id: str, chat_message: ChatMessage):
+    """Run one WebSocket turn under the chat concurrency limit"""
+    limiter = get_concurrency_service().chat
+    admitted = limiter.try_acquire()
+    if admitted is None:
+        await websocket.send_json({
+            "type": "error",
+            "status": 503,
+            "detail": "Server overloaded. Please try again later.",
+            "retry_after": get_settings().shed_retry_after_seconds
+        })
+        return
+    
+    # Stream duration includes the reply length and the client's reading
+    # speed, so it says nothing about capacity (as for /chat's latency)
+    try:
+        await _stream_turn(websocket, conversation_id, chat_message)
+    finally:
+        limiter.release(admitted, sample=False)
+
+async def _stream_turn(websocket: WebSocket, conversation_id: str, chat_message: ChatMessage) -> bool:
+    """Stream one reply as ``delta`` frames followed by a ``done`` frame
+    
+    Returns whether OpenAI generated the reply. A rejected turn gets an
+    ``error`` frame instead.
+    """
+    started = time.perf_counter()
+    openai_service = get_openai_service()
+    conversation_service = get_conversation_service()
+    usage_service = get_usage_service()
+    start_deadline(None, get_settings())
+    
+    history = conversation_service.get_conversation_history(conversation_id)
+    reservation = await usage_service.admit(
+        user_id=chat_message.user_id,
+        business_id=chat_message.business_id,
+        endpoint="chat",
+        estimated_tokens=openai_service.estimate_request_tokens(
+            chat_message.message, history, chat_message.business_context
+        )
+    )
+    if not reservation.allowed:
+        await websocket.send_json({
+            "type": "error",
+            "status": reservation.status_code,
+            "detail": f"{reservation.error}. Please try again later."
+        })
+        return False
+    
+    conversation_service.add_message(conversation_id, "user", chat_message.message)
+    
+    ai_response = None
+    try:
+        async with aclosing(openai_service.stream_email_response(
+            email_content=chat_message.message,
+            conversation_history=history,
+            tone=chat_message.tone,
+            industry=chat_message.industry,
+            language=chat_message.language,
+            business_context=chat_message.business_context,
+            model=reservation.model
+        )) as stream:
+            async for item in stream:
+                if isinstance(item, str):
+                    await websocket.send_json({"type": "delta", "content": item})
+                else:
+                    ai_response = item
+    except BaseException:
+        # Cancelled, or the client went away while the reply was streaming
+        _settle_cancelled(chat_message, reservation, history)
+        raise
+    
+    # The reply joins the conversation before the next turn reads it; usage
+    # and percentiles are settled in the background once the frame is sent
+    if ai_response["success"]:
+        _store_reply(conversation_id, ai_response)
+    e2e_latency_ms = (time.perf_counter() - started) * 1000
+    try:
+        await websocket.send_json({
+            "type": "done",
+            "conversation_id": conversation_id,
+            "response": ai_response["response"],
+            "language": ai_response["language"],
+            "tokens_used": ai_response.get("tokens_used", 0),
+            "success": ai_response["success"],
+            "error": ai_response.get("error")
+        })
+    finally:
+        get_task_pipeline().submit(
+            conversation_id, _settle_chat, chat_message, reservation, ai_response, e2e_latency_ms
+        )
+    return ai_response["success"]
+
+async def _submit_background(key: str, job, *args):
+    """Queue a bookkeeping job; used as a response's background task so the
+    job cannot run before the response is sent"""
+    get_task_pipeline().submit(key, job, *args)
+
+def _settle_cancelled(chat_message: ChatMessage, reservation, conversation_history=None):
+    """Release the token reservation of a cancelled request
+    
+    The prompt OpenAI had already started on is recorded as cancelled usage.
+    """
+    openai_service = get_openai_service()
+    get_usage_service().settle(
+        reservation,
+        tokens_used=openai_service.estimate_prompt_tokens(
+            chat_message.message, conversation_history, chat_message.business_context
+        ),
+        model=reservation.model or openai_service.settings.openai_model,
+        cancelled=True
+    )
+
+def _record_chat(
+    chat_message: ChatMessage,
+    reservation,
+    ai_response: Dict[str, Any],
+    conversation_id: str,
+    e2e_latency_ms: float
+):
+    """Store the reply, settle usage and record distributions for a chat request"""
+    if ai_response["success"]:
+        _store_reply(conversation_id, ai_response)
+    _settle_chat(chat_message, reservation, ai_response, e2e_latency_ms)
+
+def _store_reply(conversation_id: str, ai_response: Dict[str, Any]):
+    """Add a generated reply to its conversation"""
+    get_conversation_service().add_message(
+        conversation_id, "assistant", ai_response["response"],
+        metadata={
+            "tokens_used": ai_response["tokens_used"],
+            "model": ai_response["model"]
+        }
+    )
+
+def _settle_chat(
+    chat_message: ChatMessage,
+    reservation,
+    ai_response: Dict[str, Any],
+    e2e_latency_ms: float
+):
+    """Settle usage and record latency and token distributions"""
+    openai_service = get_openai_service()
+    quantile_service = get_quantile_service()
+    
+    # Record usage and release any unused token reservation
+    get_usage_service().settle(
+        reservation,
+        tokens_used=ai_response.get("tokens_used", 0),
+        model=ai_response.get("model", openai_service.settings.openai_model),
+        prompt_tokens=ai_response.get("prompt_tokens"),
+        completion_tokens=ai_response.get("completion_tokens", 0),
+        cached_tokens=ai_response.get("cached_tokens", 0)
+    )
+    
+    # Latency and token distributions
+    model = ai_response.get("model")
+    if ai_response["success"]:
+        quantile_service.record(
+            "openai_latency_ms", ai_response["latency_ms"],
+            model=model, business_id=chat_message.business_id
+        )
+        quantile_service.record(
+            "tokens_per_request", ai_response["tokens_used"],
+            model=model, business_id=chat_message.business_id
         )
+    quantile_service.record(
+        "e2e_latency_ms", e2e_latency_ms,
+        model=model, business_id=chat_message.business_id
+    )
 
 def _get_fallback_response(tone: str, language: str, industry: str) -> str:
     """Provide fallback responses when OpenAI is unavailable"""
@@ -219,3 +754,7 @@ def _get_fallback_response(tone: str, language: str, industry: str) -> str:
     
     # Get response
     return responses.get(lang, responses["en"]).get(tone, responses[lang]["professional"]).get(industry, responses[lang][tone]["general"])
+
+if __name__ == "__main__":
+    from app.server import run
+    run(app)
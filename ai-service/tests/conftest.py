@@ -0,0 +1,12 @@
+"""
+Shared setup for the unit tests
+
+Run from the ai-service directory with ``python -m pytest``.
+"""
+
+import os
+
+# Settings require these; unit tests never talk to real services
+for _name in ("OPENAI_API_KEY", "API_KEY", "SECRET_KEY", "CORS_ORIGIN"):
+    os.environ.setdefault(_name, "test")
+os.environ.setdefault("USAGE_LEDGER_PATH", "")
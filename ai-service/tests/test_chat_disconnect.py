@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from fastapi import Request
+from fastapi.responses import Response
+
+import main
+
+class SlowChat:
+    """Stands in for ``_limited_chat``; counts generations"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, chat_message):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return Response(f"reply {self.calls}", media_type="text/plain"), True
+
+def _disconnected_request() -> Request:
+    """Request whose client has already gone away"""
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    return Request({"type": "http", "method": "POST", "path": "/chat", "headers": []}, receive)
+
+@pytest.fixture
+def slow_chat(monkeypatch):
+    slow_chat = SlowChat()
+    monkeypatch.setattr(main, "_limited_chat", slow_chat)
+    return slow_chat
+
+def _chat(idempotency_key=None):
+    chat_message = main.ChatMessage(message="Hola", user_id="disconnect-user")
+    return main.chat(_disconnected_request(), chat_message, idempotency_key=idempotency_key, request_timeout_ms=None)
+
+def test_disconnect_cancels_requests_without_a_key(slow_chat):
+    response = asyncio.run(_chat())
+
+    assert response.status_code == 499
+
+def test_keyed_request_finishes_after_disconnect_and_is_replayed(slow_chat):
+    async def scenario():
+        first = await _chat("retry-after-timeout")
+        retry = await _chat("retry-after-timeout")
+        return first, retry
+
+    first, retry = asyncio.run(scenario())
+
+    assert first.status_code == 200
+    assert retry.body == first.body == b"reply 1"
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert slow_chat.calls == 1
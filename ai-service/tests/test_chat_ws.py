@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import WebSocketDisconnect
+from websockets.exceptions import ConnectionClosedOK
+
+import main
+from config.settings import get_settings
+from app.services.concurrency_service import get_concurrency_service
+from app.services.metrics_service import get_metrics_service
+
+class FakeWebSocket:
+    """Client that sends ``messages`` and then closes
+
+    Sends fail once ``fail_after`` frames have been sent, as they do when
+    the client has closed but the receive side has not seen it yet.
+    """
+
+    def __init__(self, messages, fail_after: int = 1000):
+        self.sent = []
+        self._messages = list(messages)
+        self.fail_after = fail_after
+        self.finished = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        if len(self.sent) >= self.fail_after:
+            raise ConnectionClosedOK(None, None)
+        self.sent.append(data)
+        if data["type"] == "done":
+            self.finished.set()
+
+    async def receive_text(self):
+        if self._messages:
+            return self._messages.pop(0)
+        await self.finished.wait()
+        raise WebSocketDisconnect(1000)
+
+class FakeOpenAIService:
+    settings = get_settings()
+
+    def estimate_request_tokens(self, *args, **kwargs):
+        return 10
+
+    def estimate_prompt_tokens(self, *args, **kwargs):
+        return 5
+
+    async def stream_email_response(self, **kwargs):
+        for delta in ("Hola", " amigo"):
+            await asyncio.sleep(0)
+            yield delta
+        yield {
+            "response": "Hola amigo", "tone": "friendly", "language": "es", "model": "gpt-4",
+            "tokens_used": 12, "prompt_tokens": 8, "completion_tokens": 4, "cached_tokens": 0,
+            "latency_ms": 5.0, "success": True
+        }
+
+@pytest.fixture(autouse=True)
+def fake_openai(monkeypatch):
+    monkeypatch.setattr(main, "get_openai_service", lambda: FakeOpenAIService())
+
+def _run(websocket: FakeWebSocket):
+    async def session():
+        await main.chat_ws(websocket, user_id="ws-user", business_id=None, tone="friendly",
+                           industry="hospitality", language="es")
+        # Let background bookkeeping run
+        await asyncio.sleep(0.01)
+    asyncio.run(session())
+
+def test_streams_deltas_then_done_without_sampling_the_limiter():
+    limiter = get_concurrency_service().chat
+    baseline = limiter.baseline
+    websocket = FakeWebSocket([json.dumps({"message": "Hola"})])
+
+    _run(websocket)
+
+    assert [frame["type"] for frame in websocket.sent] == ["session", "delta", "delta", "done"]
+    assert websocket.sent[-1]["response"] == "Hola amigo"
+    assert limiter.inflight == 0
+    assert limiter.baseline == baseline
+
+def test_send_on_a_closed_connection_counts_as_a_cancelled_turn(caplog):
+    cancellations = get_metrics_service().cancellations
+    before = cancellations.value("chat_ws")
+    # The session frame and the first delta are delivered, then the client is gone
+    websocket = FakeWebSocket([json.dumps({"message": "Hola"})], fail_after=2)
+
+    _run(websocket)
+
+    assert cancellations.value("chat_ws") == before + 1
+    assert get_concurrency_service().chat.inflight == 0
+    assert not [record for record in caplog.records if record.levelname == "WARNING"]
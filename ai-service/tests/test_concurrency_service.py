@@ -0,0 +1,88 @@
+import heapq
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import concurrency_service
+from app.services.concurrency_service import AdaptiveLimiter
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(concurrency_service, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def _simulate(limiter: AdaptiveLimiter, clock, latency: float, concurrency: int, completions: int) -> int:
+    """Closed loop of ``concurrency`` clients; returns how many requests were shed
+
+    Every admitted request takes ``latency``; a shed client retries one
+    latency later.
+    """
+    events = [(clock.now + latency * i / concurrency, i, None) for i in range(concurrency)]
+    heapq.heapify(events)
+    shed = done = 0
+    sequence = concurrency
+    while done < completions:
+        clock.now, _, started = heapq.heappop(events)
+        sequence += 1
+        if started is not None:
+            limiter.release(started)
+            done += 1
+            heapq.heappush(events, (clock.now, sequence, None))
+            continue
+        admitted = limiter.try_acquire()
+        if admitted is None:
+            shed += 1
+            heapq.heappush(events, (clock.now + latency, sequence, None))
+        else:
+            heapq.heappush(events, (clock.now + latency, sequence, admitted))
+    # Drain the requests still in flight
+    for finish, _, started in sorted(events):
+        if started is not None:
+            clock.now = max(clock.now, finish)
+            limiter.release(started)
+    return shed
+
+def test_admits_up_to_the_limit_and_sheds_beyond_it(clock):
+    limiter = AdaptiveLimiter("test", initial=2, minimum=1, maximum=10)
+
+    assert limiter.try_acquire() is not None
+    assert limiter.try_acquire() is not None
+    assert limiter.try_acquire() is None
+    assert limiter.shed == 1
+
+def test_grows_while_the_limit_is_used(clock):
+    limiter = AdaptiveLimiter("test", initial=4, minimum=1, maximum=64)
+    _simulate(limiter, clock, latency=0.5, concurrency=4, completions=200)
+
+    assert limiter.limit > 8
+
+def test_upstream_rejection_backs_off_once_per_round_trip(clock):
+    limiter = AdaptiveLimiter("test", initial=20, minimum=1, maximum=64, backoff=0.5)
+    started = [limiter.try_acquire() for _ in range(4)]
+    clock.now += 1.0
+    for admitted in started:
+        limiter.release(admitted, overloaded=True)
+
+    assert limiter.limit == 10
+    assert limiter.decreases == 1
+
+def test_latency_spike_shrinks_the_limit(clock):
+    limiter = AdaptiveLimiter("test", initial=64, minimum=4, maximum=256)
+    _simulate(limiter, clock, latency=0.5, concurrency=24, completions=2000)
+    limit = limiter.limit
+    _simulate(limiter, clock, latency=5.0, concurrency=24, completions=24)
+
+    assert limiter.limit < limit
+
+def test_permanent_latency_step_does_not_ratchet_to_the_minimum(clock):
+    limiter = AdaptiveLimiter("test", initial=64, minimum=4, maximum=256)
+    _simulate(limiter, clock, latency=0.5, concurrency=24, completions=2000)
+
+    # Longer replies or a slower model: a new normal, not overload
+    _simulate(limiter, clock, latency=1.2, concurrency=24, completions=2000)
+    shed = _simulate(limiter, clock, latency=1.2, concurrency=24, completions=2000)
+
+    assert limiter.limit >= 24
+    assert shed == 0
+    assert limiter.baseline == pytest.approx(1.2, rel=0.1)
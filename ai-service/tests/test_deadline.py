@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from config.settings import get_settings
+from app.services import deadline, openai_service
+from app.services.deadline import current_deadline, start_deadline
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(deadline, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def _settings(**update):
+    return get_settings().model_copy(update=update)
+
+def _start(budget_ms, settings):
+    # Each test starts its deadline in a fresh context, like a request task
+    return contextvars.Context().run(lambda: (start_deadline(budget_ms, settings), current_deadline()))
+
+def test_budget_is_the_smaller_of_header_and_setting(clock):
+    settings = _settings(chat_deadline_ms=30000)
+
+    started, current = _start(5000, settings)
+    assert current is started
+    assert started.remaining() == pytest.approx(5.0)
+
+    assert _start(60000, settings)[0].remaining() == pytest.approx(30.0)
+
+def test_unset_or_non_positive_budgets_are_ignored(clock):
+    assert _start(None, _settings(chat_deadline_ms=2000))[0].remaining() == pytest.approx(2.0)
+    assert _start(-5, _settings(chat_deadline_ms=2000))[0].remaining() == pytest.approx(2.0)
+    assert _start(1500, _settings(chat_deadline_ms=0))[0].remaining() == pytest.approx(1.5)
+    assert _start(0, _settings(chat_deadline_ms=0)) == (None, None)
+
+def test_deadline_expires_when_the_budget_runs_out(clock):
+    started, _ = _start(1000, _settings(chat_deadline_ms=0))
+    clock.now += 0.999
+    assert not started.expired()
+    clock.now += 0.001
+    assert started.expired()
+    assert started.remaining() == pytest.approx(0.0)
+
+def test_deadline_reaches_child_tasks_only(clock):
+    async def scenario():
+        async def child():
+            return current_deadline()
+
+        started = start_deadline(1000, _settings(chat_deadline_ms=0))
+        return started, await asyncio.create_task(child())
+
+    started, seen = asyncio.run(scenario())
+    assert seen is started
+    assert current_deadline() is None
+
+@pytest.fixture
+def service(monkeypatch, clock):
+    settings = _settings(
+        chat_deadline_ms=0,
+        openai_max_tokens=1000,
+        deadline_margin_ms=250,
+        deadline_tokens_per_second=40.0,
+        deadline_min_tokens=32
+    )
+    monkeypatch.setattr(openai_service, "get_settings", lambda: settings)
+    return openai_service.OpenAIService()
+
+def test_request_budget_without_deadline_uses_defaults(service):
+    assert contextvars.Context().run(service._request_budget) == (None, 1000)
+
+def test_request_budget_leaves_margin_and_caps_max_tokens(service, clock):
+    def budget(budget_ms):
+        start_deadline(budget_ms, service.settings)
+        return service._request_budget()
+
+    timeout, max_tokens = contextvars.Context().run(budget, 5250)
+    assert timeout == pytest.approx(5.0)
+    assert max_tokens == 200
+
+    timeout, max_tokens = contextvars.Context().run(budget, 60000)
+    assert max_tokens == 1000
+
+def test_deadline_too_close_skips_the_call(service, clock):
+    def budget(budget_ms):
+        start_deadline(budget_ms, service.settings)
+        return service._request_budget()
+
+    timeout, max_tokens = contextvars.Context().run(budget, 1000)
+    assert max_tokens == 30
+    assert service._deadline_too_close(timeout, max_tokens)
+    assert service.metrics.fallbacks.value("deadline") >= 1
+
+    timeout, max_tokens = contextvars.Context().run(budget, 2000)
+    assert not service._deadline_too_close(timeout, max_tokens)
+    assert not service._deadline_too_close(None, 0)
+
+def test_timeout_option_keeps_the_configured_connect_and_pool_timeouts():
+    settings = _settings(openai_timeout=60.0, openai_connect_timeout=5.0, openai_pool_timeout=2.0)
+
+    assert openai_service._timeout_option(None, settings) == {}
+
+    timeout = openai_service._timeout_option(20.0, settings)["timeout"]
+    assert (timeout.read, timeout.write, timeout.connect, timeout.pool) == (20.0, 20.0, 5.0, 2.0)
+
+    timeout = openai_service._timeout_option(1.0, settings)["timeout"]
+    assert (timeout.read, timeout.connect, timeout.pool) == (1.0, 1.0, 1.0)
+
+class _TimingOutCompletions:
+    """Raises the SDK timeout as the per-request timeout runs out
+
+    It fires a few milliseconds early, as the SDK's timer can when it races
+    the deadline's own.
+    """
+
+    async def create(self, timeout, **params):
+        import httpx
+        import openai
+
+        await asyncio.sleep(timeout.read - 0.005)
+        raise openai.APITimeoutError(request=httpx.Request("POST", "http://upstream/v1/chat/completions"))
+
+def test_sdk_timeout_at_the_deadline_is_not_overload(service, monkeypatch):
+    # The SDK timeout runs on real time, so the deadline does too
+    monkeypatch.setattr(deadline, "time", time)
+    service.settings = service.settings.model_copy(update={"deadline_tokens_per_second": 10000.0})
+    for upstream in service.pool.upstreams:
+        upstream.client = SimpleNamespace(chat=SimpleNamespace(completions=_TimingOutCompletions()))
+    limit = service.limiter.limit
+
+    async def generate():
+        start_deadline(300, service.settings)
+        return await service.generate_email_response("Hola")
+
+    result = asyncio.run(generate())
+
+    assert result["error"] == "Deadline exceeded"
+    assert service.limiter.limit == limit
+
+def test_default_deadline_leaves_room_for_max_tokens(monkeypatch, clock):
+    settings = get_settings()
+    monkeypatch.setattr(openai_service, "get_settings", lambda: settings)
+    service = openai_service.OpenAIService()
+
+    def budget():
+        start_deadline(None, settings)
+        return service._request_budget()
+
+    assert contextvars.Context().run(budget)[1] == settings.openai_max_tokens
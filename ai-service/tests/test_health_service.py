@@ -0,0 +1,46 @@
+import asyncio
+import sqlite3
+import time
+
+from config.settings import get_settings
+from app.services import health_service
+
+def _prober(monkeypatch, **overrides) -> health_service.HealthProber:
+    settings = get_settings().model_copy(update=overrides)
+    monkeypatch.setattr(health_service, "get_settings", lambda: settings)
+    return health_service.HealthProber()
+
+def test_store_check_passes_before_the_ledger_exists_without_creating_it(monkeypatch, tmp_path):
+    path = tmp_path / "ledger.db"
+    prober = _prober(monkeypatch, usage_ledger_path=str(path))
+
+    asyncio.run(prober._check_store())
+
+    assert not path.exists()
+
+def test_store_check_opens_an_existing_ledger_read_only(monkeypatch, tmp_path):
+    path = tmp_path / "ledger.db"
+    sqlite3.connect(str(path)).close()
+    prober = _prober(monkeypatch, usage_ledger_path=str(path))
+
+    asyncio.run(prober._check_store())
+
+def _mark(prober: health_service.HealthProber, name: str, healthy: bool):
+    status = prober.statuses[name]
+    status.healthy = healthy
+    status.checked_at = time.monotonic()
+
+def test_readiness_requires_openai_by_default(monkeypatch):
+    prober = _prober(monkeypatch, usage_ledger_path="x.db")
+    _mark(prober, "openai", False)
+    _mark(prober, "store", True)
+
+    assert not prober.is_ready()
+
+def test_readiness_can_ignore_openai(monkeypatch):
+    prober = _prober(monkeypatch, usage_ledger_path="x.db", readiness_requires_openai=False)
+    _mark(prober, "openai", False)
+    _mark(prober, "store", True)
+
+    assert prober.is_ready()
+    assert prober.get_status()["openai"]["healthy"] is False
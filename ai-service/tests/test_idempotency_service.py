@@ -0,0 +1,153 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.services import idempotency_service
+from app.services.idempotency_service import IdempotencyService
+from config.settings import get_settings
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(idempotency_service, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+@pytest.fixture
+def service(monkeypatch, clock):
+    settings = get_settings().model_copy(update={"idempotency_ttl_seconds": 60, "idempotency_max_entries": 2})
+    monkeypatch.setattr(idempotency_service, "get_settings", lambda: settings)
+    return IdempotencyService()
+
+class Producer:
+    """``produce`` callable that counts calls and can be held open"""
+
+    def __init__(self, body: bytes = b"ok", cacheable: bool = True):
+        self.body = body
+        self.cacheable = cacheable
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        return Response(self.body + str(self.calls).encode(), media_type="text/plain"), self.cacheable
+
+def test_completed_response_is_replayed(service):
+    produce = Producer()
+
+    async def scenario():
+        first = await service.run("k", "f", produce)
+        second = await service.run("k", "f", produce)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert produce.calls == 1
+    assert second.body == first.body == b"ok1"
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+def test_fingerprint_mismatch_is_rejected(service):
+    async def scenario():
+        await service.run("k", "f", Producer())
+        await service.run("k", "other", Producer())
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 422
+
+def test_non_cacheable_result_is_not_stored(service):
+    produce = Producer(cacheable=False)
+
+    async def scenario():
+        await service.run("k", "f", produce)
+        return await service.run("k", "f", produce)
+
+    assert asyncio.run(scenario()).body == b"ok2"
+    assert produce.calls == 2
+
+def test_duplicates_attach_to_the_inflight_request(service):
+    produce = Producer()
+
+    async def scenario():
+        produce.release = asyncio.Event()
+        first = asyncio.create_task(service.run("k", "f", produce))
+        await asyncio.sleep(0)
+        duplicates = [asyncio.create_task(service.run("k", "f", produce)) for _ in range(3)]
+        await asyncio.sleep(0)
+        mismatch = asyncio.create_task(service.run("k", "other", produce))
+        produce.release.set()
+        results = await asyncio.gather(first, *duplicates)
+        with pytest.raises(HTTPException):
+            await mismatch
+        return results
+
+    results = asyncio.run(scenario())
+    assert produce.calls == 1
+    assert {response.body for response in results} == {b"ok1"}
+    assert service.get_store_sizes() == {"idempotency_results": 1, "idempotency_inflight": 0}
+
+def test_duplicates_see_the_original_error(service):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def failing():
+            await release.wait()
+            raise RuntimeError("upstream down")
+
+        first = asyncio.create_task(service.run("k", "f", failing))
+        await asyncio.sleep(0)
+        duplicate = asyncio.create_task(service.run("k", "f", Producer()))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, duplicate, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert service.get_store_sizes()["idempotency_inflight"] == 0
+
+def test_first_waiter_takes_over_a_cancelled_request(service):
+    produce = Producer()
+
+    async def scenario():
+        produce.release = asyncio.Event()
+        first = asyncio.create_task(service.run("k", "f", produce))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(service.run("k", "f", produce)) for _ in range(2)]
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        # Exactly one waiter restarts the generation; the other attaches to it
+        await asyncio.sleep(0)
+        produce.release.set()
+        results = await asyncio.gather(*waiters)
+        assert first.cancelled()
+        return results
+
+    results = asyncio.run(scenario())
+    assert produce.calls == 2
+    assert {response.body for response in results} == {b"ok2"}
+
+def test_results_expire_after_the_ttl(service, clock):
+    produce = Producer()
+
+    async def scenario():
+        await service.run("k", "f", produce)
+        clock.now += 59
+        assert (await service.run("k", "f", produce)).body == b"ok1"
+        clock.now += 1
+        return await service.run("k", "f", produce)
+
+    assert asyncio.run(scenario()).body == b"ok2"
+
+def test_store_evicts_oldest_beyond_max_entries(service, clock):
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await service.run(key, "f", Producer(key.encode()))
+            clock.now += 1
+
+    asyncio.run(scenario())
+    assert list(service._completed) == ["b", "c"]
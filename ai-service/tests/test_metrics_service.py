@@ -0,0 +1,54 @@
+import pytest
+
+from app.services.metrics_service import MetricsService
+
+def test_registering_the_same_counter_twice_returns_the_existing_one():
+    metrics = MetricsService()
+    first = metrics.counter("test_total", "Test counter", ("kind",))
+    first.inc("a")
+
+    second = metrics.counter("test_total", "Test counter", ("kind",))
+
+    assert second is first
+    assert second.value("a") == 1
+
+def test_registering_a_gauge_again_reads_the_newest_callback():
+    metrics = MetricsService()
+    metrics.gauge("test_gauge", "Test gauge", lambda: 1)
+    metrics.gauge("test_gauge", "Test gauge", lambda: 2)
+
+    assert "test_gauge 2" in metrics.render().splitlines()
+
+def test_registering_a_different_definition_under_a_name_fails():
+    metrics = MetricsService()
+    metrics.counter("test_total", "Test counter", ("kind",))
+
+    with pytest.raises(ValueError):
+        metrics.counter("test_total", "Test counter", ("other",))
+    with pytest.raises(ValueError):
+        metrics.gauge("test_total", "Test counter", lambda: 0, ("kind",))
+
+def test_workers_render_each_others_series_under_one_family(tmp_path):
+    workers = [MetricsService(), MetricsService()]
+    for index, metrics in enumerate(workers):
+        metrics.enable_multiprocess(str(tmp_path), str(index))
+        metrics.fallbacks.inc("shed", amount=index + 1)
+    workers[1].write_snapshot()
+
+    lines = workers[0].render().splitlines()
+
+    assert lines.count("# TYPE caboai_fallback_responses_total counter") == 1
+    assert 'caboai_fallback_responses_total{reason="shed",worker="0"} 1' in lines
+    assert 'caboai_fallback_responses_total{reason="shed",worker="1"} 2' in lines
+    start = lines.index("# TYPE caboai_fallback_responses_total counter")
+    assert all(line.startswith("caboai_fallback_responses_total") for line in lines[start + 1:start + 3])
+
+def test_histogram_series_carry_the_worker_label(tmp_path):
+    metrics = MetricsService()
+    metrics.enable_multiprocess(str(tmp_path), "3")
+    metrics.request_duration.observe(0.2, "/chat")
+
+    lines = metrics.render().splitlines()
+
+    assert 'caboai_http_request_duration_seconds_bucket{route="/chat",worker="3",le="0.25"} 1' in lines
+    assert 'caboai_http_request_duration_seconds_count{route="/chat",worker="3"} 1' in lines
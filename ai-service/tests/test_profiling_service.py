@@ -0,0 +1,22 @@
+import pytest
+
+from app.services import profiling_service
+from app.services.profiling_service import SamplingProfiler
+from config.settings import get_settings
+
+def _profiler(monkeypatch, **update) -> SamplingProfiler:
+    settings = get_settings().model_copy(update={"profiling_sample_rate": 0.0, **update})
+    monkeypatch.setattr(profiling_service, "get_settings", lambda: settings)
+    return SamplingProfiler()
+
+def test_header_is_ignored_without_a_token(monkeypatch):
+    profiler = _profiler(monkeypatch, profiling_token=None)
+
+    assert not profiler.should_profile({b"x-debug-profile": b"1"})
+
+@pytest.mark.parametrize("value, expected", [(b"s3cret", True), (b"wrong", False), (b"", False)])
+def test_header_needs_the_profiling_token(monkeypatch, value, expected):
+    profiler = _profiler(monkeypatch, profiling_token="s3cret")
+
+    assert profiler.should_profile({b"x-debug-profile": value}) is expected
+    assert not profiler.should_profile({})
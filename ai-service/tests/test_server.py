@@ -0,0 +1,19 @@
+import pytest
+
+from app import server
+from config.settings import get_settings
+
+def test_several_workers_are_refused_with_per_worker_state(monkeypatch):
+    settings = get_settings().model_copy(update={"workers": 2, "allow_per_worker_state": False})
+    monkeypatch.setattr(server, "warm", lambda: pytest.fail("refused before warming up"))
+
+    with pytest.raises(SystemExit) as exit:
+        server.run(object(), settings)
+
+    assert "ALLOW_PER_WORKER_STATE" in str(exit.value)
+    assert "rate limits" in str(exit.value)
+
+def test_per_worker_state_leaves_out_disabled_quotas():
+    settings = get_settings().model_copy(update={"token_quota_user_tpm": 0, "token_quota_business_tpm": 0})
+
+    assert server.per_worker_state(settings) == ["rate limits", "Idempotency-Key results", "conversation history"]
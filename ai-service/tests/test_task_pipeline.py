@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from app.services import task_pipeline
+from app.services.metrics_service import MetricsService
+from app.services.task_pipeline import TaskPipeline
+from config.settings import get_settings
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    settings = get_settings().model_copy(update={"background_drain_timeout": 1.0})
+    monkeypatch.setattr(task_pipeline, "get_settings", lambda: settings)
+    monkeypatch.setattr(task_pipeline, "get_metrics_service", MetricsService)
+    return TaskPipeline()
+
+def test_jobs_run_in_order_per_key_after_submit_returns(pipeline):
+    ran = []
+
+    async def scenario():
+        for i in range(3):
+            pipeline.submit("a", ran.append, f"a{i}")
+            pipeline.submit("b", ran.append, f"b{i}")
+        # Nothing runs on the submitting request's turn
+        assert ran == []
+        assert pipeline.pending == 6
+        await pipeline.drain()
+
+    asyncio.run(scenario())
+    assert [job for job in ran if job[0] == "a"] == ["a0", "a1", "a2"]
+    assert [job for job in ran if job[0] == "b"] == ["b0", "b1", "b2"]
+    # Keys are independent and interleave
+    assert ran.index("b0") < ran.index("a2")
+    assert pipeline.pending == 0
+    assert pipeline.jobs.value("ok") == 6
+
+def test_jobs_submitted_while_a_key_drains_join_its_queue(pipeline):
+    ran = []
+
+    def first():
+        ran.append("first")
+        pipeline.submit("a", ran.append, "second")
+
+    async def scenario():
+        pipeline.submit("a", first)
+        pipeline.submit("a", ran.append, "queued")
+        await pipeline.drain()
+
+    asyncio.run(scenario())
+    assert ran == ["first", "queued", "second"]
+
+def test_failing_job_is_counted_and_does_not_stop_the_key(pipeline):
+    ran = []
+
+    def failing():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        pipeline.submit("a", failing)
+        pipeline.submit("a", ran.append, "after")
+        await pipeline.drain()
+
+    asyncio.run(scenario())
+    assert ran == ["after"]
+    assert pipeline.jobs.value("error") == 1
+    assert pipeline.jobs.value("ok") == 1
+
+def test_jobs_do_not_inherit_the_submitting_context(pipeline):
+    seen = []
+
+    async def scenario():
+        request_id.set("req-1")
+        pipeline.submit("a", lambda: seen.append(request_id.get()))
+        await pipeline.drain()
+
+    asyncio.run(scenario())
+    assert seen == [None]
+
+def test_jobs_submitted_after_drain_run_inline(pipeline):
+    ran = []
+
+    async def scenario():
+        await pipeline.drain()
+        pipeline.submit("a", ran.append, "inline")
+        assert ran == ["inline"]
+
+    asyncio.run(scenario())
+    assert pipeline.pending == 0
+
+def test_drain_gives_up_after_the_timeout(pipeline, caplog):
+    async def scenario():
+        blocker = asyncio.Event()
+
+        async def never_drains(key):
+            await blocker.wait()
+
+        pipeline._drain_key = never_drains
+        pipeline.submit("a", print)
+        await pipeline.drain()
+        assert pipeline.pending == 1
+        blocker.set()
+
+    pipeline.settings = pipeline.settings.model_copy(update={"background_drain_timeout": 0.01})
+    asyncio.run(scenario())
+    assert "still pending" in caplog.text
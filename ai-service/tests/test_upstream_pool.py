@@ -0,0 +1,144 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from config.settings import get_settings
+from app.services import openai_service
+from app.services.deadline import start_deadline
+from app.services.upstream_pool import Upstream, UpstreamPool
+
+def _pool(*names, **kwargs) -> UpstreamPool:
+    return UpstreamPool([Upstream(name, client=None) for name in names], **kwargs)
+
+def test_least_outstanding_spreads_concurrent_requests():
+    pool = _pool("a", "b")
+    first = pool.select()
+    pool.start(first)
+    second = pool.select()
+
+    assert {first.name, second.name} == {"a", "b"}
+
+def test_ewma_prefers_the_faster_endpoint():
+    pool = _pool("fast", "slow", strategy="ewma")
+    fast, slow = pool.upstreams
+    pool.finish(fast, pool.start(fast) - 0.05)
+    pool.finish(slow, pool.start(slow) - 0.5)
+
+    assert all(pool.select() is fast for _ in range(5))
+
+def test_consecutive_failures_eject_and_a_success_restores():
+    pool = _pool("a", "b", eject_failures=2, eject_seconds=60)
+    bad, good = pool.upstreams
+    for _ in range(2):
+        pool.finish(bad, pool.start(bad), failed=True)
+
+    assert pool.get_stats()["a"]["ejected"]
+    assert all(pool.select() is good for _ in range(5))
+
+    pool.finish(bad, pool.start(bad))
+    assert not pool.get_stats()["a"]["ejected"]
+
+def test_all_endpoints_ejected_still_serves():
+    pool = _pool("a", eject_failures=1, eject_seconds=60)
+    pool.finish(pool.upstreams[0], pool.start(pool.upstreams[0]), failed=True)
+
+    assert pool.select() is pool.upstreams[0]
+
+class _FakeCompletions:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.hang = False
+        self.models = []
+
+    async def create(self, model: str, **params):
+        self.models.append(model)
+        if self.hang:
+            await asyncio.Event().wait()
+        if self.fail:
+            import httpx
+            import openai
+            request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+            raise openai.InternalServerError("boom", response=httpx.Response(500, request=request), body=None)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Thank you"))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2, prompt_tokens_details=None)
+        )
+
+@pytest.fixture
+def service(monkeypatch):
+    settings = get_settings().model_copy(update={
+        "openai_endpoints": [
+            {"name": "primary", "model": "gateway-gpt-4"},
+            {"name": "secondary"}
+        ],
+        "openai_model": "gpt-4",
+        "openai_eject_failures": 2,
+        "deadline_margin_ms": 0,
+        "deadline_min_tokens": 1
+    })
+    monkeypatch.setattr(openai_service, "get_settings", lambda: settings)
+    service = openai_service.OpenAIService()
+    for upstream in service.pool.upstreams:
+        upstream.client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions()))
+    return service
+
+def test_endpoint_model_applies_without_an_override(service):
+    primary = service.pool.upstreams[0]
+    _, upstream, _, model = asyncio.run(service._create(None, messages=[]))
+
+    assert upstream is primary
+    assert model == "gateway-gpt-4"
+
+def test_budget_downgrade_model_wins_over_the_endpoint_model(service):
+    _, upstream, _, model = asyncio.run(service._create("gpt-3.5-turbo", messages=[]))
+
+    assert model == "gpt-3.5-turbo"
+    assert upstream.client.chat.completions.models == ["gpt-3.5-turbo"]
+
+def test_endpoint_failure_fails_over(service):
+    primary, secondary = service.pool.upstreams
+    primary.client.chat.completions.fail = True
+
+    _, upstream, _, model = asyncio.run(service._create(None, messages=[]))
+
+    assert upstream is secondary
+    assert model == "gpt-4"
+    assert service.pool.failovers.value("primary") >= 1
+
+def test_endpoint_hanging_until_the_deadline_is_ejected(service):
+    primary, secondary = service.pool.upstreams
+    primary.client.chat.completions.hang = True
+
+    async def generate():
+        start_deadline(50, service.settings)
+        return await service.generate_email_response("Hola")
+
+    results = [asyncio.run(generate()) for _ in range(6)]
+
+    assert [result["error"] for result in results if not result["success"]] == ["Deadline exceeded"] * 2
+    assert all(result["success"] for result in results[-3:])
+    stats = service.pool.get_stats()
+    assert stats["primary"]["ejected"]
+    assert stats["primary"]["failures"] == 2
+    assert service.pool.requests.value("primary", "ok") == 0
+
+def test_cancelled_request_leaves_the_endpoint_alone(service):
+    primary = service.pool.upstreams[0]
+    primary.consecutive_failures = 1
+    primary.client.chat.completions.hang = True
+
+    async def cancel():
+        task = asyncio.create_task(service._create(None, messages=[]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+
+    assert primary.consecutive_failures == 1
+    assert primary.outstanding == 0
+    assert service.pool.requests.value("primary", "ok") == 0
+    assert service.pool.requests.value("primary", "cancelled") == 1
@@ -0,0 +1,46 @@
+import sqlite3
+
+from app.services.usage_ledger import UsageLedger
+
+def _row(timestamp: float, cost: float = 0.01) -> tuple:
+    return (timestamp, "user1", "biz1", "chat", "gpt-4", 120, 100, 20, 0, cost)
+
+def test_appended_rows_are_written_on_close(tmp_path):
+    ledger = UsageLedger(str(tmp_path / "ledger.db"), flush_interval=0.01)
+    ledger.append(_row(1.0))
+    ledger.append(_row(2.0))
+    ledger.close()
+
+    assert ledger.records_written == 2
+    assert [row[0] for row in ledger.replay(0)] == [1.0, 2.0]
+
+def test_failed_batch_is_retried_then_spilled_and_recovered(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ledger = UsageLedger(path, retry_attempts=3, retry_backoff=0)
+
+    # A database without the ledger table fails every insert
+    broken = sqlite3.connect(str(tmp_path / "broken.db"))
+    ledger._write(broken, [_row(1.0), _row(2.0, cost=0.5)])
+    broken.close()
+
+    assert ledger.write_errors == 3
+    assert ledger.records_spilled == 2
+    assert ledger.records_dropped == 0
+    assert list(ledger.replay(0)) == []
+
+    reopened = UsageLedger(path)
+    assert reopened.records_recovered == 2
+    assert [row[0] for row in reopened.replay(0)] == [1.0, 2.0]
+    assert reopened.spend_totals(0) == {"business:biz1": 0.51, "user:user1": 0.51}
+    assert not (tmp_path / "ledger.db.spill.jsonl").exists()
+
+def test_records_are_counted_as_dropped_when_spill_fails(tmp_path):
+    ledger = UsageLedger(str(tmp_path / "ledger.db"), retry_attempts=1, retry_backoff=0)
+    ledger.spill_path = str(tmp_path / "missing" / "spill.jsonl")
+
+    broken = sqlite3.connect(str(tmp_path / "broken.db"))
+    ledger._write(broken, [_row(1.0)])
+    broken.close()
+
+    assert ledger.records_dropped == 1
+    assert ledger.get_stats()["records_dropped"] == 1
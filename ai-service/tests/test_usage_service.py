@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import usage_service
+from app.services.usage_service import RateLimiter, TokenQuota
+from config.settings import get_settings
+
+@pytest.fixture
+def settings(monkeypatch):
+    settings = get_settings().model_copy(update={
+        "rate_limit_requests": 10,
+        "rate_limit_window": 60,
+        "rate_limit_endpoint_limits": {"chat": 2},
+        "token_quota_user_tpm": 6000,
+        "token_quota_business_tpm": 12000
+    })
+    monkeypatch.setattr(usage_service, "get_settings", lambda: settings)
+    return settings
+
+def test_rate_limiter_allows_a_burst_then_one_request_per_interval(settings):
+    limiter = RateLimiter()
+    assert all(limiter.acquire("u:default", now=100.0) for _ in range(10))
+    assert not limiter.acquire("u:default", now=100.0)
+    # One request frees up every window / limit seconds
+    assert not limiter.acquire("u:default", now=105.9)
+    assert limiter.acquire("u:default", now=106.0)
+    assert not limiter.acquire("u:default", now=106.0)
+
+def test_rate_limiter_rejection_does_not_consume(settings):
+    limiter = RateLimiter()
+    for _ in range(10):
+        limiter.acquire("u:default", now=100.0)
+    for _ in range(5):
+        assert not limiter.acquire("u:default", now=100.0)
+    assert limiter.acquire("u:default", now=106.0)
+
+def test_rate_limiter_uses_endpoint_limits_and_reports_status(settings):
+    limiter = RateLimiter()
+    assert limiter.status("u:chat", "chat", now=100.0).requests_remaining == 2
+    assert limiter.acquire("u:chat", "chat", now=100.0)
+    assert limiter.acquire("u:chat", "chat", now=100.0)
+    assert not limiter.acquire("u:chat", "chat", now=100.0)
+    assert limiter.status("u:chat", "chat", now=100.0).requests_remaining == 0
+    assert limiter.status("u:chat", "chat", now=130.0).requests_remaining == 1
+    # Other keys are unaffected
+    assert limiter.acquire("v:chat", "chat", now=100.0)
+
+def test_rate_limiter_sweeps_replenished_keys(settings):
+    limiter = RateLimiter()
+    limiter.acquire("u:default", now=100.0)
+    limiter.acquire("v:default", now=limiter._next_sweep - 1)
+    limiter.acquire("w:default", now=limiter._next_sweep + 1)
+    assert "u:default" not in limiter._tats
+    assert set(limiter._tats) == {"v:default", "w:default"}
+
+def test_token_quota_keys(settings):
+    quota = TokenQuota()
+    assert quota.keys_for("u", None) == ("user:u",)
+    assert quota.keys_for("u", "b") == ("user:u", "business:b")
+    assert quota.keys_for(None, "b") == ("business:b",)
+    assert quota.keys_for(None, None) == ("user:anonymous",)
+
+def test_token_quota_reserve_is_all_or_nothing(settings):
+    quota = TokenQuota()
+    keys = quota.keys_for("u", "b")
+    assert quota.reserve(keys, 6000, now=100.0)
+    # The user bucket is full, so the business bucket must not be charged either
+    business_tat = quota._tats["business:b"]
+    assert not quota.reserve(keys, 1000, now=100.0)
+    assert quota._tats["business:b"] == business_tat
+    assert quota.reserve(("business:b",), 6000, now=100.0)
+    assert not quota.reserve(("business:b",), 1, now=100.0)
+
+def test_token_quota_admits_an_oversized_request_into_an_empty_bucket(settings):
+    quota = TokenQuota()
+    keys = ("user:u",)
+    assert quota.reserve(keys, 50000, now=100.0)
+    assert not quota.reserve(keys, 1, now=100.0)
+    # Only the quota itself was charged, so the bucket drains within a window
+    assert quota.reserve(keys, 6000, now=160.0)
+
+def test_token_quota_adjust_charges_and_refunds(settings):
+    quota = TokenQuota()
+    keys = ("user:u",)
+    assert quota.reserve(keys, 3000, now=100.0)
+    # Actual usage was lower than the estimate: the difference is refunded
+    quota.adjust(keys, -2000)
+    assert quota.reserve(keys, 5000, now=100.0)
+    assert not quota.reserve(keys, 1, now=100.0)
+    # Charges go through even past the quota and push admission back
+    quota.adjust(keys, 6000)
+    assert not quota.reserve(keys, 1, now=159.0)
+    assert quota.reserve(keys, 1, now=161.0)
+
+def test_token_quota_adjust_ignores_refunds_for_unknown_keys(settings):
+    quota = TokenQuota()
+    quota.adjust(("user:u",), -1000)
+    assert "user:u" not in quota._tats
+    quota.adjust(("user:u",), 0)
+    assert quota._tats == {}
+
+def test_settle_reconciles_against_what_was_charged_for_an_oversized_estimate(settings):
+    service = usage_service.UsageService()
+    quota = service.token_quota
+
+    async def scenario():
+        reservation = await service.admit(user_id="u", endpoint="chat", estimated_tokens=50000)
+        assert reservation.allowed
+        assert reservation.reserved_tokens == (6000,)
+        service.settle(reservation, tokens_used=1000)
+
+    asyncio.run(scenario())
+    # Only the 1000 tokens used remain charged, not 1000 - 50000
+    assert quota._tats["user:u"] - time.monotonic() == pytest.approx(10.0, abs=0.5)
+    assert quota.reserve(("user:u",), 4900)
+    assert not quota.reserve(("user:u",), 200)
+
+def test_rate_limit_rejection_refunds_only_what_was_charged(settings):
+    service = usage_service.UsageService()
+
+    async def scenario():
+        for _ in range(2):
+            assert (await service.admit(user_id="u", endpoint="chat")).allowed
+        return await service.admit(user_id="u", endpoint="chat", estimated_tokens=50000)
+
+    rejected = asyncio.run(scenario())
+    assert rejected.error == "Rate limit exceeded"
+    assert service.token_quota._tats["user:u"] == pytest.approx(time.monotonic(), abs=0.5)